@@ -0,0 +1,316 @@
+"""Benchmarks for the calculator service.
+
+Drives /calculate and /trig with fixed, seeded expression mixes and prints a
+JSON report with throughput, p50/p99 latency and peak RSS per mix.
+
+    python bench/run.py                          # in-process, Flask test client
+    python bench/run.py --target http --url http://127.0.0.1:8000 --concurrency 16
+    python bench/run.py --engine                 # eval() baseline vs the AST engine
+    python bench/run.py --tokenizer              # regex + str.replace front end vs tokenize()
+
+Use --output to write the report to a file, and --no-cache to measure the
+engine rather than the expression cache. For --target http, pass the
+server's --server-pid to include its peak RSS.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import re
+import resource
+import sys
+import threading
+import time
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculator
+
+# Expression mixes
+
+def simple_arithmetic(rng, count):
+    ops = ['+', '-', '*', '/', '%']
+    expressions = []
+    for _ in range(count):
+        terms = [str(rng.randint(1, 999)) if rng.random() < 0.7 else '%.2f' % rng.uniform(0, 100)
+                 for _ in range(rng.randint(2, 6))]
+        expression = terms[0]
+        for term in terms[1:]:
+            expression += rng.choice(ops) + term
+        expressions.append(expression)
+    return expressions
+
+def deep_parentheses(rng, count):
+    expressions = []
+    for _ in range(count):
+        depth = rng.randint(20, 60)
+        expression = str(rng.randint(1, 9))
+        for _ in range(depth):
+            expression = '(%s%s%d)' % (expression, rng.choice('+-*'), rng.randint(1, 9))
+        expressions.append(expression)
+    return expressions
+
+def large_powers(rng, count):
+    expressions = []
+    for _ in range(count):
+        base = rng.randint(2, 9)
+        exponent = rng.randint(1000, 4000)
+        if rng.random() < 0.5:
+            expressions.append('%d^%d' % (base, exponent))
+        else:
+            expressions.append('%d^%d%%%d^%d' % (base, exponent, rng.randint(2, 9), exponent // 2))
+    return expressions
+
+def long_expressions(rng, count):
+    # Long, spaced-out expressions using the × ÷ ^ spellings the UI sends
+    ops = [' + ', ' - ', ' × ', ' ÷ ', ' % ', '^']
+    expressions = []
+    for _ in range(count):
+        expression = str(rng.randint(1, 99))
+        op = None
+        for _ in range(rng.randint(150, 250)):
+            # No chained powers, which would overflow
+            op = rng.choice(ops[:-1] if op == '^' else ops)
+            expression += op + (str(rng.randint(1, 3)) if op == '^' else '%.3f' % rng.uniform(1, 100))
+        expressions.append(expression)
+    return expressions
+
+def trig_sweep(rng, count):
+    functions = ['sin', 'cos', 'tan', 'asin', 'acos', 'atan']
+    bodies = []
+    for _ in range(count):
+        func = rng.choice(functions)
+        if func.startswith('a'):
+            value = rng.uniform(-1, 1)
+        else:
+            value = rng.uniform(-360, 360)
+        bodies.append({'function': func, 'value': value, 'mode': rng.choice(['degrees', 'radians'])})
+    return bodies
+
+def trig_vector(rng, count, size=1000):
+    bodies = []
+    for _ in range(count):
+        step = 360.0 / size
+        start = rng.uniform(0, 360)
+        bodies.append({'function': rng.choice(['sin', 'cos', 'tan']),
+                       'values': [start + i * step for i in range(size)]})
+    return bodies
+
+# mix name: (route, generator, uses the expression engine)
+MIXES = {
+    'simple_arithmetic': ('/calculate', simple_arithmetic, True),
+    'deep_parentheses': ('/calculate', deep_parentheses, True),
+    'large_powers': ('/calculate', large_powers, True),
+    'long_expressions': ('/calculate', long_expressions, True),
+    'trig_sweep': ('/trig', trig_sweep, False),
+    'trig_vector_1000': ('/trig', trig_vector, False),
+}
+
+def build_requests(mix, count, seed):
+    route, generate, is_expression = MIXES[mix]
+    items = generate(random.Random('%s-%d' % (mix, seed)), count)
+    if is_expression:
+        items = [{'expression': expression} for expression in items]
+    return route, [json.dumps(item).encode() for item in items]
+
+# Measurement
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(math.ceil(p / 100.0 * len(latencies))) - 1)] * 1000
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': len(latencies) / elapsed if elapsed else None,
+        'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else None,
+        'p50_ms': percentile(50),
+        'p99_ms': percentile(99),
+    }
+
+def run_client(route, bodies, repeat):
+    client = calculator.app.test_client()
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            start = time.perf_counter()
+            response = client.post(route, data=body, content_type='application/json')
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200 or not response.get_json().get('success'):
+                errors += 1
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+def run_http(url, route, bodies, repeat, concurrency):
+    parsed = urllib.parse.urlsplit(url)
+    jobs = [body for _ in range(repeat) for body in bodies]
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+
+    def worker(index):
+        connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80)
+        for body in jobs[index::concurrency]:
+            start = time.perf_counter()
+            try:
+                connection.request('POST', route, body, {'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                payload = json.loads(response.read())
+                if response.status != 200 or not payload.get('success'):
+                    errors[index] += 1
+            except (OSError, http.client.HTTPException, ValueError):
+                errors[index] += 1
+                connection.close()
+                connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80)
+            latencies[index].append(time.perf_counter() - start)
+        connection.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return summarize([l for per_thread in latencies for l in per_thread], sum(errors), elapsed)
+
+# eval() baseline, as /calculate was implemented before the AST engine
+
+def legacy_calculate(expression):
+    try:
+        if not re.match(r'^[\d.+\-*/%()^\s]+$', expression):
+            return {'success': False, 'error': 'Invalid expression'}
+        expression = expression.replace('×', '*').replace('÷', '/')
+        expression = expression.replace('^', '**')
+        expression = expression.replace('%', '%')
+        result = eval(expression)
+        if isinstance(result, float):
+            result = round(result, 10)
+        return {'success': True, 'result': result}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+# Validation and tokenizing as they were before tokenize() did both in one
+# pass: a validation regex, a str.replace per alternate spelling, then a
+# regex match per token
+
+_LEGACY_TOKEN_RE = re.compile(r'\s*(?:(\d+\.?\d*|\.\d+)|(\*\*|//|[-+*/%^()]))')
+
+def legacy_tokenize(expression):
+    if not re.match(r'^[\d.+\-*/%()^\s×÷]+$', expression):
+        raise ValueError('Invalid expression')
+    expression = expression.replace('×', '*').replace('÷', '/')
+    tokens = []
+    pos = 0
+    end = len(expression.rstrip())
+    while pos < end:
+        match = _LEGACY_TOKEN_RE.match(expression, pos)
+        if match is None:
+            raise ValueError('Invalid expression')
+        number, op = match.groups()
+        if number is not None:
+            tokens.append(('num', float(number) if '.' in number else int(number), number))
+        else:
+            tokens.append(('op', '**' if op == '^' else op))
+        pos = match.end()
+    return tokens
+
+def run_engine(expressions, repeat, functions=None):
+    results = {}
+    for name, function in functions or (('eval', legacy_calculate), ('engine', calculator.calculate)):
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for expression in expressions:
+                start = time.perf_counter()
+                function(expression)
+                latencies.append(time.perf_counter() - start)
+        results[name] = summarize(latencies, 0, time.perf_counter() - started)
+    return results
+
+def peak_rss_kb(pid=None):
+    if pid is None:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == 'darwin' else peak
+    with open('/proc/%d/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=['client', 'http'], default='client')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--engine', action='store_true',
+                        help='compare the eval() baseline with the AST engine in-process')
+    parser.add_argument('--tokenizer', action='store_true',
+                        help='compare the old validate/replace/tokenize front end with tokenize()')
+    parser.add_argument('--mix', action='append', choices=sorted(MIXES),
+                        help='mixes to run (default: all)')
+    parser.add_argument('--requests', type=int, default=500, help='distinct requests per mix')
+    parser.add_argument('--repeat', type=int, default=2, help='passes over each mix')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads for --target http')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-cache', action='store_true', help='disable the expression cache (in-process only)')
+    parser.add_argument('--server-pid', type=int, help='server process to report peak RSS for')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.no_cache:
+        calculator.expression_cache.maxsize = 0
+    # Keep timeouts from turning slow runs into errors
+    calculator.limits.timeout = None
+
+    report = {
+        'target': 'tokenizer' if args.tokenizer else 'engine' if args.engine else args.target,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        'requests_per_mix': args.requests,
+        'repeat': args.repeat,
+        'cache': not args.no_cache,
+        'mixes': {},
+    }
+    if args.target == 'http' and not (args.engine or args.tokenizer):
+        report['url'] = args.url
+        report['concurrency'] = args.concurrency
+
+    for mix in args.mix or list(MIXES):
+        route, bodies = build_requests(mix, args.requests, args.seed)
+        if args.engine or args.tokenizer:
+            if route != '/calculate':
+                continue
+            expressions = [json.loads(body)['expression'] for body in bodies]
+            functions = None
+            if args.tokenizer:
+                functions = (('legacy', legacy_tokenize), ('tokenize', calculator.tokenize))
+            report['mixes'][mix] = run_engine(expressions, args.repeat, functions)
+        elif args.target == 'client':
+            report['mixes'][mix] = run_client(route, bodies, args.repeat)
+        else:
+            report['mixes'][mix] = run_http(args.url, route, bodies, args.repeat, args.concurrency)
+
+    report['peak_rss_kb'] = peak_rss_kb()
+    if args.server_pid:
+        report['server_peak_rss_kb'] = peak_rss_kb(args.server_pid)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Cold start report for the calculator service.
+
+Imports calculator in fresh interpreters under -X importtime, times the
+import and the first POST /calculate, and prints a JSON report with the
+median timings, the slowest modules and any lazily loaded subsystems that
+were imported anyway.
+
+    python bench/startup.py                      # 5 runs, 250 ms budget
+    python bench/startup.py --api-only --budget-ms 120
+    python bench/startup.py --top 25 --output startup.json
+
+Exits with status 1 when the median cold start (import plus first request)
+is over --budget-ms, or when a lazily loaded subsystem was imported, so it
+can gate CI.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Subsystems calculator.py only imports on first use; none of them should be
+# loaded by a plain /calculate
+LAZY_MODULES = ['numpy', 'pyarrow', 'msgpack', 'fractions', 'asyncio', 'concurrent.futures',
+                'sqlite3', 'gzip', 'cProfile', 'pstats', 'argparse']
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import calculator
+imported = time.perf_counter()
+response = calculator.app.test_client().post('/calculate', json={'expression': '2+3*4'})
+assert response.get_json()['success']
+done = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (done - imported) * 1000,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+''' % (LAZY_MODULES,)
+
+def parse_importtime(stderr):
+    # -X importtime lines are "import time: self | cumulative | name", in
+    # completion order with children indented under (and before) their
+    # parent. Returns the modules imported by calculator.
+    modules = []
+    pending = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('| imported package'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        pending.append((name.strip(), self_us, cumulative_us))
+        if depth == 0:
+            if name.strip() == 'calculator':
+                modules = pending
+            pending = []
+    return modules
+
+def run_once(api_only):
+    env = dict(os.environ)
+    env.pop('CALCULATOR_API_ONLY', None)
+    if api_only:
+        env['CALCULATOR_API_ONLY'] = '1'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout)
+    timings['modules'] = parse_importtime(result.stderr)
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to time')
+    parser.add_argument('--budget-ms', type=float, default=250.0,
+                        help='allowed median import plus first request time')
+    parser.add_argument('--api-only', action='store_true', help='start with CALCULATOR_API_ONLY=1')
+    parser.add_argument('--top', type=int, default=15, help='slowest modules to list')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.api_only) for _ in range(args.runs)]
+    import_ms = statistics.median(run['import_ms'] for run in runs)
+    first_request_ms = statistics.median(run['first_request_ms'] for run in runs)
+    cold_start_ms = statistics.median(run['import_ms'] + run['first_request_ms'] for run in runs)
+
+    # Per-module medians across runs, in milliseconds
+    samples = {}
+    for run in runs:
+        for name, self_us, cumulative_us in run['modules']:
+            samples.setdefault(name, []).append((self_us, cumulative_us))
+    modules = [{'module': name,
+                'self_ms': statistics.median(s for s, _ in values) / 1000,
+                'cumulative_ms': statistics.median(c for _, c in values) / 1000}
+               for name, values in samples.items()]
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': args.runs,
+        'api_only': args.api_only,
+        'import_ms': import_ms,
+        'first_request_ms': first_request_ms,
+        'cold_start_ms': cold_start_ms,
+        'budget_ms': args.budget_ms,
+        'within_budget': cold_start_ms <= args.budget_ms,
+        'modules_imported': len(modules),
+        'eagerly_loaded': sorted({name for run in runs for name in run['loaded']}),
+        'slowest_self': sorted(modules, key=lambda m: m['self_ms'], reverse=True)[:args.top],
+        'slowest_cumulative': sorted(modules, key=lambda m: m['cumulative_ms'], reverse=True)[:args.top],
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    if report['eagerly_loaded']:
+        sys.exit('imported at startup: %s' % ', '.join(report['eagerly_loaded']))
+    if not report['within_budget']:
+        sys.exit('cold start %.1f ms is over the %.1f ms budget' % (cold_start_ms, args.budget_ms))
+
+if __name__ == '__main__':
+    main()
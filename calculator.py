@@ -1,1131 +1,2496 @@
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, abort, g, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+import os
 import re
+import sys
+import json
+import logging
 import math
+import decimal
+import bisect
+import io
+import hashlib
+import contextvars
+import time
+import urllib.parse
+import importlib.util
+import operator
+import threading
+import weakref
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Startup
+#
+# Cold start is mostly imports, so anything a plain /calculate doesn't need
+# is imported on first use: NumPy (vectorized functions, bulk and binary
+# responses; see load_numpy()), pyarrow and msgpack (binary formats),
+# fractions (fraction mode), asyncio (asgi_app), concurrent.futures (the
+# offload pool), sqlite3 (history), gzip (the page's assets), cProfile and
+# the command line parser. decimal stays, Flask imports it anyway.
+# bench/startup.py reports the import time against a budget.
+#
+# API-only instances (CALCULATOR_API_ONLY=1, or serve --api-only) don't
+# serve the page or its assets, so they never read or compress them.
+
+np = None
+_numpy_lock = threading.Lock()
+_installed = {}
+
+def has_module(name):
+    # Whether an optional dependency is installed, without importing it
+    found = _installed.get(name)
+    if found is None:
+        found = _installed[name] = importlib.util.find_spec(name) is not None
+    return found
+
+def load_numpy():
+    # Imports NumPy and sets up the vectorized functions on first use;
+    # None when NumPy isn't installed
+    global np
+    if np is None and has_module('numpy'):
+        with _numpy_lock:
+            if np is None:
+                import numpy
+                _register_vector_functions(numpy)
+                np = numpy
+    return np
 
 app = Flask(__name__)
+app.config.setdefault('API_ONLY', os.environ.get('CALCULATOR_API_ONLY', '') not in ('', '0'))
 
-# HTML template for the calculator
-HTML_TEMPLATE = '''
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Calculator</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            min-height: 100vh;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            transition: background 0.3s;
-        }
-        
-        body.dark-mode {
-            background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%);
-        }
-        
-        .container {
-            display: flex;
-            gap: 30px;
-            flex-wrap: wrap;
-            justify-content: center;
-            align-items: flex-start;
-            padding: 20px;
-        }
-        
-        .header {
-            position: absolute;
-            top: 20px;
-            right: 20px;
-            display: flex;
-            gap: 10px;
-        }
-        
-        .toggle-btn {
-            background: linear-gradient(145deg, rgba(255, 255, 255, 0.4) 0%, rgba(255, 255, 255, 0.2) 100%);
-            color: white;
-            border: 1px solid rgba(255, 255, 255, 0.3);
-            padding: 12px 18px;
-            border-radius: 10px;
-            cursor: pointer;
-            font-weight: 700;
-            transition: all 0.3s;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.2);
-            font-size: 14px;
-            letter-spacing: 0.5px;
-        }
-        
-        .toggle-btn:hover {
-            background: linear-gradient(145deg, rgba(255, 255, 255, 0.6) 0%, rgba(255, 255, 255, 0.4) 100%);
-            transform: translateY(-2px);
-            box-shadow: 0 6px 20px rgba(0, 0, 0, 0.3);
-        }
-        
-        .toggle-btn:active {
-            transform: translateY(0);
-        }
-        
-        .calculator-container {
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3);
-            padding: 25px;
-            width: 430px;
-            transition: background 0.3s;
-        }
-        
-        .dark-mode .calculator-container {
-            background: #222;
-            color: white;
-        }
-        
-        .display-container {
-            background: linear-gradient(145deg, #1a1a1a 0%, #0a0a0a 100%);
-            border-radius: 12px;
-            padding: 18px;
-            margin-bottom: 25px;
-            min-height: 100px;
-            display: flex;
-            flex-direction: column;
-            justify-content: space-between;
-            box-shadow: inset 0 2px 5px rgba(0, 0, 0, 0.5), inset 0 -2px 5px rgba(0, 0, 0, 0.3);
-            border: 1px solid #333;
-        }
-        
-        .dark-mode .display-container {
-            background: linear-gradient(145deg, #111 0%, #000 100%);
-            border: 1px solid #333;
-        }
-        
-        .display-info {
-            display: flex;
-            justify-content: space-between;
-            font-size: 13px;
-            color: #666;
-            margin-bottom: 8px;
-        }
-        
-        .memory-indicator {
-            background: linear-gradient(145deg, #667eea 0%, #5568d3 100%);
-            color: white;
-            padding: 3px 8px;
-            border-radius: 5px;
-            font-size: 11px;
-            font-weight: 600;
-            box-shadow: 0 2px 8px rgba(102, 126, 234, 0.3);
-        }
-        
-        .expression {
-            color: #555;
-            font-size: 16px;
-            text-align: right;
-            word-wrap: break-word;
-            word-break: break-all;
-            min-height: 20px;
-            font-weight: 500;
-        }
-        
-        .dark-mode .expression {
-            color: #888;
-        }
-        
-        .display {
-            color: #fff;
-            font-size: 38px;
-            text-align: right;
-            word-wrap: break-word;
-            word-break: break-all;
-            min-height: 50px;
-            display: flex;
-            align-items: flex-end;
-            justify-content: flex-end;
-            font-weight: 600;
-            letter-spacing: 1px;
-        }
-        
-        .buttons {
-            display: grid;
-            grid-template-columns: repeat(5, 1fr);
-            gap: 12px;
-        }
-        
-        button {
-            padding: 18px 12px;
-            font-size: 16px;
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-            transition: all 0.15s ease;
-            font-weight: 600;
-            position: relative;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.2), inset 0 -2px 0 rgba(0, 0, 0, 0.2);
-            user-select: none;
-            letter-spacing: 0.5px;
-        }
-        
-        button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 6px 20px rgba(0, 0, 0, 0.25), inset 0 -2px 0 rgba(0, 0, 0, 0.2);
-        }
-        
-        button:active {
-            transform: translateY(1px);
-            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.15), inset 0 -1px 0 rgba(0, 0, 0, 0.2);
-        }
-        
-        button:hover::after {
-            content: attr(data-tooltip);
-            position: absolute;
-            bottom: 110%;
-            left: 50%;
-            transform: translateX(-50%);
-            background: rgba(0, 0, 0, 0.9);
-            color: white;
-            padding: 6px 12px;
-            border-radius: 6px;
-            font-size: 12px;
-            white-space: nowrap;
-            margin-bottom: 8px;
-            z-index: 1000;
-            pointer-events: none;
-            font-weight: 500;
-        }
-        
-        .number {
-            background: linear-gradient(145deg, #f8f9fa 0%, #e9ecef 100%);
-            color: #212529;
-            border: 1px solid #dee2e6;
-        }
-        
-        .number:hover {
-            background: linear-gradient(145deg, #ffffff 0%, #f0f3f7 100%);
-            box-shadow: 0 6px 20px rgba(0, 0, 0, 0.15), inset 0 -2px 0 rgba(0, 0, 0, 0.2);
-        }
-        
-        .number:active {
-            background: linear-gradient(145deg, #e9ecef 0%, #dee2e6 100%);
-        }
-        
-        .dark-mode .number {
-            background: linear-gradient(145deg, #444 0%, #333 100%);
-            color: #fff;
-            border: 1px solid #555;
-        }
-        
-        .dark-mode .number:hover {
-            background: linear-gradient(145deg, #555 0%, #444 100%);
-        }
-        
-        .dark-mode .number:active {
-            background: linear-gradient(145deg, #333 0%, #222 100%);
-        }
-        
-        .operator {
-            background: linear-gradient(145deg, #667eea 0%, #5568d3 100%);
-            color: white;
-            border: 1px solid #4a52bf;
-        }
-        
-        .operator:hover {
-            background: linear-gradient(145deg, #7e8fef 0%, #6979e0 100%);
-            box-shadow: 0 6px 20px rgba(102, 126, 234, 0.4), inset 0 -2px 0 rgba(0, 0, 0, 0.2);
-        }
-        
-        .operator:active {
-            background: linear-gradient(145deg, #5568d3 0%, #4a52bf 100%);
-        }
-        
-        .dark-mode .operator {
-            background: linear-gradient(145deg, #7e8fef 0%, #6979e0 100%);
-        }
-        
-        .dark-mode .operator:hover {
-            background: linear-gradient(145deg, #9aa5f7 0%, #8f99f0 100%);
-        }
-        
-        .equals {
-            background: linear-gradient(145deg, #48bb78 0%, #38a169 100%);
-            color: white;
-            grid-column: span 5;
-            border: 1px solid #2f855a;
-            font-size: 18px;
-        }
-        
-        .equals:hover {
-            background: linear-gradient(145deg, #5ac98f 0%, #48bb78 100%);
-            box-shadow: 0 6px 20px rgba(72, 187, 120, 0.4), inset 0 -2px 0 rgba(0, 0, 0, 0.2);
-        }
-        
-        .equals:active {
-            background: linear-gradient(145deg, #38a169 0%, #2f855a 100%);
-        }
-        
-        .dark-mode .equals:hover {
-            background: linear-gradient(145deg, #68d391 0%, #5ac98f 100%);
-        }
-        
-        .clear {
-            background: linear-gradient(145deg, #f56565 0%, #e53e3e 100%);
-            color: white;
-            grid-column: span 2;
-            border: 1px solid #c53030;
-        }
-        
-        .clear:hover {
-            background: linear-gradient(145deg, #fa8072 0%, #f56565 100%);
-            box-shadow: 0 6px 20px rgba(245, 101, 101, 0.4), inset 0 -2px 0 rgba(0, 0, 0, 0.2);
-        }
-        
-        .clear:active {
-            background: linear-gradient(145deg, #e53e3e 0%, #c53030 100%);
-        }
-        
-        .dark-mode .clear {
-            background: linear-gradient(145deg, #fa8072 0%, #f56565 100%);
-        }
-        
-        .dark-mode .clear:hover {
-            background: linear-gradient(145deg, #ffb3b3 0%, #fa8072 100%);
-        }
-        
-        .memory-btn {
-            background: linear-gradient(145deg, #ed8936 0%, #dd6b20 100%);
-            color: white;
-            font-size: 14px;
-            border: 1px solid #c05621;
-        }
-        
-        .memory-btn:hover {
-            background: linear-gradient(145deg, #f6ad55 0%, #ed8936 100%);
-            box-shadow: 0 6px 20px rgba(237, 137, 54, 0.4), inset 0 -2px 0 rgba(0, 0, 0, 0.2);
-        }
-        
-        .memory-btn:active {
-            background: linear-gradient(145deg, #dd6b20 0%, #c05621 100%);
-        }
-        
-        .dark-mode .memory-btn {
-            background: linear-gradient(145deg, #f6ad55 0%, #ed8936 100%);
-        }
-        
-        .dark-mode .memory-btn:hover {
-            background: linear-gradient(145deg, #fcc28e 0%, #f6ad55 100%);
-        }
-        
-        h1 {
-            text-align: center;
-            color: white;
-            margin-bottom: 25px;
-            font-size: 32px;
-            font-weight: 800;
-            letter-spacing: -0.5px;
-            text-shadow: 0 2px 10px rgba(0, 0, 0, 0.3);
-        }
-        
-        .history-panel {
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3);
-            padding: 25px;
-            width: 300px;
-            max-height: 600px;
-            overflow-y: auto;
-        }
-        
-        .dark-mode .history-panel {
-            background: #222;
-            color: white;
-        }
-        
-        .history-panel h3 {
-            margin-top: 0;
-            color: #667eea;
-            border-bottom: 2px solid #667eea;
-            padding-bottom: 12px;
-            font-size: 16px;
-            font-weight: 700;
-        }
-        
-        .history-item {
-            padding: 12px;
-            margin: 8px 0;
-            background: linear-gradient(145deg, #f8f9fa 0%, #e9ecef 100%);
-            border-radius: 8px;
-            font-size: 13px;
-            cursor: pointer;
-            transition: all 0.2s;
-            border: 1px solid #dee2e6;
-            font-weight: 500;
-        }
-        
-        .dark-mode .history-item {
-            background: linear-gradient(145deg, #333 0%, #2a2a2a 100%);
-            border: 1px solid #444;
-        }
-        
-        .history-item:hover {
-            background: linear-gradient(145deg, #ffffff 0%, #f0f3f7 100%);
-            transform: translateX(5px);
-            box-shadow: 0 4px 12px rgba(102, 126, 234, 0.2);
-        }
-        
-        .dark-mode .history-item:hover {
-            background: linear-gradient(145deg, #444 0%, #3a3a3a 100%);
-            box-shadow: 0 4px 12px rgba(102, 126, 234, 0.3);
-        }
-        
-        .memory-display {
-            background: linear-gradient(145deg, #fff3cd 0%, #ffe8a1 100%);
-            padding: 12px;
-            border-radius: 8px;
-            margin-bottom: 12px;
-            font-size: 13px;
-            font-weight: 700;
-            text-align: center;
-            border: 1px solid #ffc800;
-            color: #856404;
-            box-shadow: 0 3px 10px rgba(255, 200, 0, 0.2);
-        }
-        
-        .dark-mode .memory-display {
-            background: linear-gradient(145deg, #444 0%, #333 100%);
-            color: #ffc107;
-            border: 1px solid #555;
-        }
-        
-        .clear-history {
-            width: 100%;
-            padding: 12px;
-            margin-top: 15px;
-            background: linear-gradient(145deg, #f56565 0%, #e53e3e 100%);
-            color: white;
-            border: none;
-            border-radius: 8px;
-            cursor: pointer;
-            font-weight: 600;
-            transition: all 0.2s;
-            box-shadow: 0 4px 15px rgba(0, 0, 0, 0.2);
-        }
-        
-        .clear-history:hover {
-            background: linear-gradient(145deg, #fa8072 0%, #f56565 100%);
-            box-shadow: 0 6px 20px rgba(245, 101, 101, 0.3);
-        }
-        
-        .clear-history:active {
-            transform: translateY(2px);
-        }
-        
-        .function-group {
-            margin-top: 10px;
-            padding-top: 10px;
-            border-top: 1px solid #eee;
-        }
-        
-        .dark-mode .function-group {
-            border-top: 1px solid #444;
-        }
-        
-        .function-group-title {
-            font-size: 12px;
-            color: #999;
-            text-transform: uppercase;
-            margin-bottom: 8px;
-            font-weight: bold;
-        }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <button class="toggle-btn" onclick="toggleAngleMode()" id="angleMode">DEG</button>
-        <button class="toggle-btn" onclick="toggleDarkMode()">🌙</button>
-    </div>
+# JSON
+#
+# Request bodies and responses go through FastJSONProvider, which uses
+# orjson when it is installed and the stdlib json module otherwise. orjson
+# only encodes integers up to 64 bits, so payloads with bigger ones (exact
+# powers, factorials) fall back to the stdlib encoder. It also decodes
+# bigger integers as floats, so documents with a run of 19 or more digits
+# are decoded by the stdlib, which keeps them exact. Output is compact
+# with sorted keys either way. Bodies for the most frequent constant errors
+# are encoded once, up front.
+
+def json_dumps(obj, default=None):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj, default=default, sort_keys=True, separators=(',', ':')).encode()
+
+# 19 digits, since negative ones below -2^63 already come back as floats
+_LONG_DIGITS = re.compile(r'\d{19}')
+_LONG_DIGITS_BYTES = re.compile(rb'\d{19}')
+
+def json_loads(data):
+    if orjson is not None:
+        long_digits = _LONG_DIGITS if isinstance(data, str) else _LONG_DIGITS_BYTES
+        if long_digits.search(data) is None:
+            return orjson.loads(data)
+    return json.loads(data)
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_dumps(obj, self.default).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return json_loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_dumps(obj, self.default) + b'\n', mimetype=self.mimetype)
+
+app.json = FastJSONProvider(app)
+
+PREBUILT_ERRORS = ('Invalid expression', 'Unknown function', 'asin domain error', 'acos domain error')
+_ERROR_BODIES = {error: json_dumps({'success': False, 'error': error}) + b'\n' for error in PREBUILT_ERRORS}
+
+def json_body(payload):
+    # Encoded payload, reusing the prebuilt body for constant errors
+    if len(payload) == 2 and payload.get('success') is False:
+        body = _ERROR_BODIES.get(payload['error'])
+        if body is not None:
+            return body
+    return json_dumps(payload) + b'\n'
+
+def encode_payload(payload):
+    # Returns (payload, body). Integers past Python's int-to-text limit
+    # can't be encoded, so they become an error instead of failing the
+    # response part way through.
+    try:
+        return payload, json_body(payload)
+    except ValueError:
+        payload = {'success': False, 'error': 'Result too large'}
+        return payload, json_body(payload)
+
+# Static UI assets
+#
+# The page is served from static/. On first use the CSS and JS are fingerprinted
+# by content hash and index.html is rewritten to point at the fingerprinted
+# URLs, which can then be cached forever. Every asset is kept in memory with
+# precompressed gzip (and brotli, if installed) variants and a strong ETag.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+UI_ASSETS = ('calculator.css', 'expression.js', 'calculator.js')
+
+_CONTENT_TYPES = {
+    '.html': 'text/html; charset=utf-8',
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+}
+
+class StaticAsset:
+    def __init__(self, body, content_type, immutable):
+        self.content_type = content_type
+        self.immutable = immutable
+        self.etag = hashlib.sha256(body).hexdigest()[:20]
+        import gzip
+        self.variants = {'identity': body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body)
+
+_ui_assets = None
+_ui_assets_lock = threading.Lock()
+
+def _build_ui_assets():
+    assets = {}
+    with open(os.path.join(STATIC_DIR, 'index.html'), 'rb') as f:
+        html = f.read()
+    for name in UI_ASSETS:
+        with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+            body = f.read()
+        stem, ext = os.path.splitext(name)
+        asset = StaticAsset(body, _CONTENT_TYPES[ext], immutable=True)
+        fingerprinted = '%s.%s%s' % (stem, asset.etag[:10], ext)
+        assets[fingerprinted] = asset
+        html = html.replace(('/static/' + name).encode(), ('/assets/' + fingerprinted).encode())
+    assets['index.html'] = StaticAsset(html, _CONTENT_TYPES['.html'], immutable=False)
+    return assets
+
+def ui_assets():
+    global _ui_assets
+    if _ui_assets is None:
+        with _ui_assets_lock:
+            if _ui_assets is None:
+                _ui_assets = _build_ui_assets()
+    return _ui_assets
+
+def _asset_response(asset):
+    accepted = request.accept_encodings
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in asset.variants and accepted[candidate]:
+            encoding = candidate
+            break
     
-    <div class="container">
-        <div>
-            <h1>Advanced Calculator</h1>
-            <div class="calculator-container">
-                <div class="display-container">
-                    <div class="display-info">
-                        <span id="memoryIndicator" class="memory-indicator" style="display:none;">M: <span id="memoryValue">0</span></span>
-                        <span id="angleIndicator">Degrees</span>
-                    </div>
-                    <div class="expression" id="expression"></div>
-                    <div class="display" id="display">0</div>
-                </div>
-                <div class="buttons">
-                    <!-- Row 1: Trig Functions -->
-                    <button class="operator" onclick="trigFunction('sin')" data-tooltip="Sine">sin</button>
-                    <button class="operator" onclick="trigFunction('asin')" data-tooltip="Inverse Sine">asin</button>
-                    <button class="operator" onclick="trigFunction('cos')" data-tooltip="Cosine">cos</button>
-                    <button class="operator" onclick="trigFunction('acos')" data-tooltip="Inverse Cosine">acos</button>
-                    <button class="operator" onclick="trigFunction('tan')" data-tooltip="Tangent">tan</button>
-                    
-                    <!-- Row 2: Advanced Math -->
-                    <button class="operator" onclick="squareRoot()" data-tooltip="Square Root">√</button>
-                    <button class="operator" onclick="cubeRoot()" data-tooltip="Cube Root">∛</button>
-                    <button class="operator" onclick="power()" data-tooltip="Power (x²)">x²</button>
-                    <button class="operator" onclick="customPower()" data-tooltip="Power (x^y)">x^y</button>
-                    <button class="operator" onclick="factorial()" data-tooltip="Factorial">!</button>
-                    
-                    <!-- Row 3: Logarithms & Constants -->
-                    <button class="operator" onclick="logarithm()" data-tooltip="Log (base 10)">log</button>
-                    <button class="operator" onclick="naturalLog()" data-tooltip="Natural Log">ln</button>
-                    <button class="operator" onclick="appendConstant('π')" data-tooltip="Pi">π</button>
-                    <button class="operator" onclick="appendConstant('e')" data-tooltip="Euler's number">e</button>
-                    <button class="operator" onclick="reciprocal()" data-tooltip="Reciprocal (1/x)">1/x</button>
-                    
-                    <!-- Row 4: Memory Functions -->
-                    <button class="memory-btn" onclick="memoryClear()" data-tooltip="Memory Clear">MC</button>
-                    <button class="memory-btn" onclick="memoryRecall()" data-tooltip="Memory Recall">MR</button>
-                    <button class="memory-btn" onclick="memoryAdd()" data-tooltip="Memory Add">M+</button>
-                    <button class="memory-btn" onclick="memorySubtract()" data-tooltip="Memory Subtract">M-</button>
-                    <button class="operator" onclick="modulo()" data-tooltip="Modulo">mod</button>
-                    
-                    <!-- Row 5: Basic Operations -->
-                    <button class="clear" onclick="clearDisplay()" data-tooltip="Clear (Esc)">C</button>
-                    <button class="operator" onclick="appendNumber('(')" data-tooltip="Left Paren">(</button>
-                    <button class="operator" onclick="appendNumber(')')" data-tooltip="Right Paren">)</button>
-                    <button class="operator" onclick="deleteLast()" data-tooltip="Delete (Backspace)">DEL</button>
-                    <button class="operator" onclick="exponential()" data-tooltip="e^x">eˣ</button>
-                    
-                    <!-- Row 6: Numbers 7-9 -->
-                    <button class="number" onclick="appendNumber('7')" data-tooltip="7">7</button>
-                    <button class="number" onclick="appendNumber('8')" data-tooltip="8">8</button>
-                    <button class="number" onclick="appendNumber('9')" data-tooltip="9">9</button>
-                    <button class="operator" onclick="appendOperator('/')" data-tooltip="Divide">÷</button>
-                    <button class="operator" onclick="percentage()" data-tooltip="Percentage">%</button>
-                    
-                    <!-- Row 7: Numbers 4-6 -->
-                    <button class="number" onclick="appendNumber('4')" data-tooltip="4">4</button>
-                    <button class="number" onclick="appendNumber('5')" data-tooltip="5">5</button>
-                    <button class="number" onclick="appendNumber('6')" data-tooltip="6">6</button>
-                    <button class="operator" onclick="appendOperator('*')" data-tooltip="Multiply">×</button>
-                    <button class="operator" onclick="toggleSign()" data-tooltip="Toggle Sign">±</button>
-                    
-                    <!-- Row 8: Numbers 1-3 -->
-                    <button class="number" onclick="appendNumber('1')" data-tooltip="1">1</button>
-                    <button class="number" onclick="appendNumber('2')" data-tooltip="2">2</button>
-                    <button class="number" onclick="appendNumber('3')" data-tooltip="3">3</button>
-                    <button class="operator" onclick="appendOperator('-')" data-tooltip="Subtract">−</button>
-                    <button class="operator" onclick="absolute()" data-tooltip="Absolute Value">|x|</button>
-                    
-                    <!-- Row 9: Zero, Decimal, Plus -->
-                    <button class="number" onclick="appendNumber('0')" style="grid-column: span 2;" data-tooltip="0">0</button>
-                    <button class="number" onclick="appendNumber('.')" data-tooltip="Decimal">.</button>
-                    <button class="operator" onclick="appendOperator('+')" data-tooltip="Add">+</button>
-                    
-                    <!-- Row 10: Equals -->
-                    <button class="equals" onclick="calculate()" data-tooltip="Calculate (Enter)" style="grid-column: span 5;">=</button>
-                </div>
-            </div>
-        </div>
-        
-        <!-- History Panel -->
-        <div class="history-panel">
-            <h3>History</h3>
-            <div id="historyList" style="min-height: 200px;"></div>
-            <button class="clear-history" onclick="clearHistory()">Clear History</button>
-        </div>
-    </div>
+    # Strong ETags must differ between encodings of the same content
+    etag = asset.etag if encoding == 'identity' else '%s-%s' % (asset.etag, encoding)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset.variants[encoding], content_type=asset.content_type)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
     
-    <script>
-        let display = document.getElementById('display');
-        let expressionDisplay = document.getElementById('expression');
-        let currentInput = '0';
-        let operator = null;
-        let previousValue = null;
-        let shouldResetDisplay = false;
-        let operatorSymbol = null;
-        let memory = 0;
-        let angleMode = 'degrees'; // 'degrees' or 'radians'
-        let history = [];
-        let darkMode = false;
-        
-        // Load history from localStorage
-        window.addEventListener('load', function() {
-            const savedHistory = localStorage.getItem('calcHistory');
-            if (savedHistory) {
-                history = JSON.parse(savedHistory);
-                updateHistoryDisplay();
-            }
-            const savedMemory = localStorage.getItem('calcMemory');
-            if (savedMemory) {
-                memory = parseFloat(savedMemory);
-                updateMemoryIndicator();
-            }
-        });
-        
-        function toggleDarkMode() {
-            darkMode = !darkMode;
-            document.body.classList.toggle('dark-mode');
-            localStorage.setItem('darkMode', darkMode);
-        }
-        
-        function toggleAngleMode() {
-            angleMode = angleMode === 'degrees' ? 'radians' : 'degrees';
-            document.getElementById('angleMode').textContent = angleMode === 'degrees' ? 'DEG' : 'RAD';
-            document.getElementById('angleIndicator').textContent = angleMode === 'degrees' ? 'Degrees' : 'Radians';
-        }
-        
-        function updateMemoryIndicator() {
-            const indicator = document.getElementById('memoryIndicator');
-            const value = document.getElementById('memoryValue');
-            if (memory !== 0) {
-                indicator.style.display = 'inline-block';
-                value.textContent = memory.toFixed(4);
-            } else {
-                indicator.style.display = 'none';
-            }
-            localStorage.setItem('calcMemory', memory);
-        }
-        
-        function addToHistory(expression, result) {
-            const item = expression + ' = ' + result;
-            history.unshift(item);
-            if (history.length > 50) history.pop();
-            localStorage.setItem('calcHistory', JSON.stringify(history));
-            updateHistoryDisplay();
-        }
-        
-        function updateHistoryDisplay() {
-            const list = document.getElementById('historyList');
-            if (history.length === 0) {
-                list.innerHTML = '<div style="color: #999; text-align: center; padding: 20px;">No history yet</div>';
-                return;
-            }
-            list.innerHTML = history.map((item, index) => 
-                `<div class="history-item" onclick="useHistoryItem('${item}')">${item}</div>`
-            ).join('');
-        }
-        
-        function useHistoryItem(item) {
-            const parts = item.split(' = ');
-            if (parts.length === 2) {
-                currentInput = parts[1];
-                updateDisplay();
-            }
-        }
-        
-        function clearHistory() {
-            if (confirm('Clear all history?')) {
-                history = [];
-                localStorage.removeItem('calcHistory');
-                updateHistoryDisplay();
-            }
-        }
-        
-        function memoryClear() {
-            memory = 0;
-            updateMemoryIndicator();
-        }
-        
-        function memoryRecall() {
-            currentInput = String(memory);
-            shouldResetDisplay = true;
-            updateDisplay();
-        }
-        
-        function memoryAdd() {
-            let num = parseFloat(currentInput);
-            if (!isNaN(num)) {
-                memory += num;
-                updateMemoryIndicator();
-                shouldResetDisplay = true;
-            }
-        }
-        
-        function memorySubtract() {
-            let num = parseFloat(currentInput);
-            if (!isNaN(num)) {
-                memory -= num;
-                updateMemoryIndicator();
-                shouldResetDisplay = true;
-            }
-        }
-        
-        // Keyboard support
-        document.addEventListener('keydown', function(event) {
-            const key = event.key;
-            
-            if (key >= '0' && key <= '9') {
-                appendNumber(key);
-                event.preventDefault();
-            }
-            else if (key === '.') {
-                appendNumber('.');
-                event.preventDefault();
-            }
-            else if (key === '+') {
-                appendOperator('+');
-                event.preventDefault();
-            }
-            else if (key === '-') {
-                appendOperator('-');
-                event.preventDefault();
-            }
-            else if (key === '*') {
-                appendOperator('*');
-                event.preventDefault();
-            }
-            else if (key === '/') {
-                appendOperator('/');
-                event.preventDefault();
-            }
-            else if (key === 'Enter') {
-                calculate();
-                event.preventDefault();
-            }
-            else if (key === 'Escape') {
-                clearDisplay();
-                event.preventDefault();
-            }
-            else if (key === 'Backspace') {
-                deleteLast();
-                event.preventDefault();
-            }
-            else if (key === '(') {
-                appendNumber('(');
-                event.preventDefault();
-            }
-            else if (key === ')') {
-                appendNumber(')');
-                event.preventDefault();
-            }
-        });
-        
-        function updateDisplay() {
-            display.textContent = currentInput;
-            updateExpressionDisplay();
-        }
-        
-        function updateExpressionDisplay() {
-            if (previousValue === null) {
-                expressionDisplay.textContent = '';
-            } else {
-                let expr = previousValue;
-                if (operatorSymbol) {
-                    expr += ' ' + operatorSymbol + ' ';
-                    if (!shouldResetDisplay) {
-                        expr += currentInput;
-                    }
-                }
-                expressionDisplay.textContent = expr;
-            }
-        }
-        
-        function appendNumber(num) {
-            if (shouldResetDisplay) {
-                currentInput = num;
-                shouldResetDisplay = false;
-            } else {
-                if (currentInput === '0' && num !== '.' && num !== '(' && num !== ')') {
-                    currentInput = num;
-                } else if (num === '.' && currentInput.includes('.')) {
-                    return;
-                } else {
-                    currentInput += num;
-                }
-            }
-            updateDisplay();
-        }
-        
-        function appendOperator(op) {
-            let opSymbol = op === '/' ? '÷' : op === '*' ? '×' : op;
-            
-            if (previousValue === null) {
-                previousValue = currentInput;
-            } else if (!shouldResetDisplay) {
-                calculate();
-                previousValue = display.textContent;
-            }
-            operator = op;
-            operatorSymbol = opSymbol;
-            shouldResetDisplay = true;
-            updateExpressionDisplay();
-        }
-        
-        function deleteLast() {
-            if (!shouldResetDisplay && currentInput !== '0') {
-                currentInput = currentInput.slice(0, -1);
-                if (currentInput === '') {
-                    currentInput = '0';
-                }
-                updateDisplay();
-            }
-        }
-        
-        function percentage() {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num)) {
-                    currentInput = String(num / 100);
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function modulo() {
-            if (previousValue === null) {
-                previousValue = currentInput;
-            } else if (!shouldResetDisplay) {
-                calculate();
-                previousValue = display.textContent;
-            }
-            operator = '%';
-            operatorSymbol = 'mod';
-            shouldResetDisplay = true;
-            updateExpressionDisplay();
-        }
-        
-        function absolute() {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num)) {
-                    currentInput = String(Math.abs(num));
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function cubeRoot() {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num)) {
-                    currentInput = String(Math.cbrt(num));
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function naturalLog() {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num) && num > 0) {
-                    currentInput = String(Math.log(num));
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                } else {
-                    currentInput = 'Error';
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function customPower() {
-            if (previousValue === null) {
-                previousValue = currentInput;
-            } else if (!shouldResetDisplay) {
-                calculate();
-                previousValue = display.textContent;
-            }
-            operator = '**';
-            operatorSymbol = '^';
-            shouldResetDisplay = true;
-            updateExpressionDisplay();
-        }
-        
-        function trigFunction(func) {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num)) {
-                    fetch('/trig', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json'
-                        },
-                        body: JSON.stringify({function: func, value: num, mode: angleMode})
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.success) {
-                            currentInput = String(data.result);
-                            shouldResetDisplay = true;
-                            updateDisplay();
-                        } else {
-                            currentInput = 'Error';
-                            updateDisplay();
-                        }
-                    });
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function squareRoot() {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num) && num >= 0) {
-                    currentInput = String(Math.sqrt(num));
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                } else {
-                    currentInput = 'Error';
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function power() {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num)) {
-                    currentInput = String(num * num);
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function reciprocal() {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num) && num !== 0) {
-                    currentInput = String(1 / num);
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                } else {
-                    currentInput = 'Error';
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function exponential() {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num)) {
-                    currentInput = String(Math.exp(num));
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function factorial() {
-            try {
-                let num = parseInt(currentInput);
-                if (num >= 0 && num <= 170 && Number.isInteger(num)) {
-                    let result = 1;
-                    for (let i = 2; i <= num; i++) {
-                        result *= i;
-                    }
-                    currentInput = String(result);
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                } else {
-                    currentInput = 'Error';
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function logarithm() {
-            try {
-                let num = parseFloat(currentInput);
-                if (!isNaN(num) && num > 0) {
-                    currentInput = String(Math.log10(num));
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                } else {
-                    currentInput = 'Error';
-                    updateDisplay();
-                }
-            } catch (e) {
-                currentInput = 'Error';
-                updateDisplay();
-            }
-        }
-        
-        function appendConstant(constant) {
-            if (constant === 'π') {
-                currentInput = String(Math.PI);
-                shouldResetDisplay = true;
-                updateDisplay();
-            } else if (constant === 'e') {
-                currentInput = String(Math.E);
-                shouldResetDisplay = true;
-                updateDisplay();
-            }
-        }
-        
-        function clearDisplay() {
-            currentInput = '0';
-            operator = null;
-            operatorSymbol = null;
-            previousValue = null;
-            shouldResetDisplay = false;
-            updateDisplay();
-        }
-        
-        function toggleSign() {
-            if (currentInput !== '0') {
-                currentInput = currentInput.startsWith('-') ? currentInput.slice(1) : '-' + currentInput;
-                updateDisplay();
-            }
-        }
-        
-        function calculate() {
-            if (operator === null || previousValue === null) {
-                return;
-            }
-            
-            let expression = previousValue + operator + currentInput;
-            
-            fetch('/calculate', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({expression: expression})
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.success) {
-                    currentInput = String(data.result);
-                    addToHistory(expressionDisplay.textContent, data.result);
-                    operator = null;
-                    operatorSymbol = null;
-                    previousValue = null;
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                } else {
-                    currentInput = 'Error';
-                    operator = null;
-                    operatorSymbol = null;
-                    previousValue = null;
-                    shouldResetDisplay = true;
-                    updateDisplay();
-                }
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    if asset.immutable:
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Metrics
+#
+# Counters and histograms are sharded per thread: each thread only ever
+# writes to its own dict, so recording takes no lock and never contends. A
+# scrape of /metrics copies and sums every shard. Values are per process; run
+# one scrape target per worker (or aggregate upstream) under gunicorn.
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name: (type, help, label names)
+METRICS = {
+    'calculator_requests_total': (
+        'counter', 'Requests handled, by route.', ('route',)),
+    'calculator_errors_total': (
+        'counter', 'Responses with success=false, by route and error message.', ('route', 'error')),
+    'calculator_request_duration_seconds': (
+        'histogram', 'Time spent handling a request, by route.', ('route',)),
+    'calculator_trig_duration_seconds': (
+        'histogram', 'Time spent computing /trig results, by function.', ('function',)),
+    'calculator_stage_duration_seconds': (
+        'histogram', 'Time spent in each expression evaluation stage.', ('stage',)),
+}
+
+# Error messages can embed request details (e.g. JSON decode positions), so
+# only the first few distinct ones get their own label value
+MAX_ERROR_LABELS = 100
+
+def _add_counts(totals, shard):
+    for key, value in shard.items():
+        if isinstance(value, list):
+            total = totals.setdefault(key, [0] * len(value))
+            for i, item in enumerate(value):
+                total[i] += item
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+class Metrics:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = {}
+        self._shards_lock = threading.Lock()
+        # Shards of threads that have exited, and what they had counted
+        self._dead = []
+        self._retired = {}
+        self._error_labels = set()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            # First record from this thread; the only time a lock is taken
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._retire_dead()
+                self._shards[id(shard)] = shard
+            # Thread-per-request servers start a thread for every request,
+            # so shards are folded into _retired once their thread is gone.
+            # The finalizer can run at any point, so it only queues the shard.
+            weakref.finalize(threading.current_thread(), self._dead.append, id(shard))
+            return shard
+
+    def _retire_dead(self):
+        # Called with _shards_lock held
+        while self._dead:
+            _add_counts(self._retired, self._shards.pop(self._dead.pop()))
+
+    def inc(self, name, labels, amount=1):
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, labels, seconds):
+        shard = self._shard()
+        key = (name, labels)
+        histogram = shard.get(key)
+        if histogram is None:
+            # One slot per bucket, one for +Inf, then the sum
+            histogram = shard[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    def error_label(self, error):
+        if error in self._error_labels:
+            return error
+        if len(self._error_labels) < MAX_ERROR_LABELS:
+            self._error_labels.add(error)
+            return error
+        return 'other'
+
+    def collect(self):
+        totals = {}
+        with self._shards_lock:
+            self._retire_dead()
+            _add_counts(totals, self._retired)
+            shards = list(self._shards.values())
+        for shard in shards:
+            _add_counts(totals, dict(shard))
+        return totals
+
+    def render(self):
+        totals = self.collect()
+        lines = []
+        for name, (kind, help_text, label_names) in METRICS.items():
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for (metric, labels), value in sorted(totals.items()):
+                if metric != name:
+                    continue
+                label_text = ','.join('%s="%s"' % (label, _escape_label(label_value))
+                                      for label, label_value in zip(label_names, labels))
+                if kind == 'counter':
+                    lines.append('%s{%s} %s' % (name, label_text, value))
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), value):
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (name, label_text, bound, cumulative))
+                lines.append('%s_sum{%s} %r' % (name, label_text, value[-1]))
+                lines.append('%s_count{%s} %d' % (name, label_text, cumulative))
+        return '\n'.join(lines) + '\n'
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+metrics = Metrics()
+
+def _observe_stage(stage, start):
+    end = time.perf_counter()
+    metrics.observe('calculator_stage_duration_seconds', (stage,), end - start)
+    profile = _profile.get()
+    if profile is not None:
+        profile.append((stage, end - start))
+    return end
+
+def _json_response(payload):
+    # Like jsonify(), plus serialization timing and error counting for the
+    # current route
+    start = time.perf_counter()
+    payload, body = encode_payload(payload)
+    response = app.response_class(body, mimetype='application/json')
+    _observe_stage('serialize', start)
+    if not payload.get('success', True):
+        route = request.url_rule.rule if request.url_rule else request.path
+        metrics.inc('calculator_errors_total', (route, metrics.error_label(payload['error'])))
+    return response
+
+# Bulk response formats
+#
+# Endpoints that return arrays of numbers (/calculate/batch, /evaluate with
+# columns, /trig with values, /tabulate) pick the response format from the
+# Accept header. JSON stays the default. The binary formats send float64
+# buffers taken straight from the NumPy arrays, with no float-to-text step:
+#
+#   application/octet-stream             each column as little-endian float64,
+#                                        then the validity bitmap
+#   application/msgpack                  {"success", "count", "columns": {name: bin},
+#                                         "valid": bin}, needs msgpack
+#   application/vnd.apache.arrow.stream  one record batch of float64 columns,
+#                                        NaN as null, needs pyarrow
+#
+# The validity bitmap has one bit per row, least significant bit first as in
+# Arrow, set when the row has a value. Rows without one (errors, domain
+# errors, non-finite results) hold NaN; their error messages are only sent
+# as JSON. The row count and column names are also in the X-Count and
+# X-Columns headers. Non-float results (decimal and fraction modes) are
+# always JSON.
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+def bulk_format():
+    offered = ['application/json']
+    if has_module('numpy'):
+        offered.append('application/octet-stream')
+        if has_module('msgpack'):
+            offered += ['application/msgpack', 'application/x-msgpack']
+        if has_module('pyarrow'):
+            offered.append(ARROW_STREAM)
+    format = request.accept_mimetypes.best_match(offered, 'application/json')
+    if format != 'application/json':
+        load_numpy()
+    return format
+
+def _bulk_response(format, columns):
+    # columns is a list of (name, values) of equal length
+    start = time.perf_counter()
+    names = [name for name, _ in columns]
+    arrays = [np.ascontiguousarray(values, dtype='<f8') for _, values in columns]
+    valid = np.logical_and.reduce([np.isfinite(array) for array in arrays])
+    if format == ARROW_STREAM:
+        import pyarrow as pa
+        import pyarrow.ipc
+        batch = pa.record_batch([pa.array(array, mask=~np.isfinite(array)) for array in arrays], names=names)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        body = sink.getvalue().to_pybytes()
+    else:
+        bitmap = np.packbits(valid, bitorder='little').tobytes()
+        if format == 'application/octet-stream':
+            body = b''.join([memoryview(array) for array in arrays] + [bitmap])
+        else:
+            import msgpack
+            body = msgpack.packb({
+                'success': True,
+                'count': len(valid),
+                'columns': {name: memoryview(array) for name, array in zip(names, arrays)},
+                'valid': bitmap,
             })
-            .catch(error => {
-                currentInput = 'Error';
-                operator = null;
-                operatorSymbol = null;
-                previousValue = null;
-                shouldResetDisplay = true;
-                updateDisplay();
-            });
-        }
-    </script>
-</body>
-</html>
-'''
+    _observe_stage('serialize', start)
+    return Response(body, content_type=format,
+                    headers={'X-Count': str(len(valid)), 'X-Columns': ','.join(names)})
+
+# Profiling
+#
+# A request sent with the X-Calculator-Profile header (or ?profile=... when
+# the PROFILE_QUERY_FLAG config is on) gets a Server-Timing response header
+# with the time spent in each stage: parse (tokenizing, which also
+# validates, and the cache lookup), evaluate and serialize. With the value
+# "cprofile" the request also runs under cProfile and the top functions are
+# written to the calculator.profile logger, which logs to stderr at INFO
+# whatever level the app logger is at. Requests without the header only pay
+# for one context variable lookup per stage.
+#
+# Streamed responses (/calculate/stream) are produced after the request
+# hooks have run, so they get neither the header nor a profile.
+
+PROFILE_HEADER = 'X-Calculator-Profile'
+PROFILE_TOP_FUNCTIONS = 15
+app.config.setdefault('PROFILE_QUERY_FLAG', False)
+
+profile_log = logging.getLogger('calculator.profile')
+if not profile_log.handlers:
+    profile_log.addHandler(logging.StreamHandler())
+    profile_log.setLevel(logging.INFO)
+    profile_log.propagate = False
+
+_profile = contextvars.ContextVar('calculator_profile', default=None)
+
+def _start_profile():
+    mode = request.headers.get(PROFILE_HEADER)
+    if mode is None and app.config['PROFILE_QUERY_FLAG']:
+        mode = request.args.get('profile')
+    if not mode:
+        return
+    g.profile_token = _profile.set([])
+    if mode == 'cprofile':
+        import cProfile
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+def _finish_profile(response):
+    profiler = g.pop('profiler', None)
+    if response.is_streamed:
+        if profiler is not None:
+            profiler.disable()
+        _profile.reset(g.pop('profile_token'))
+        return
+    if profiler is not None:
+        profiler.disable()
+        import pstats
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        profile_log.info('profile for %s %s\n%s', request.method, request.full_path, output.getvalue())
+    
+    stages = _profile.get()
+    _profile.reset(g.pop('profile_token'))
+    totals = {}
+    for stage, seconds in stages:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    totals['total'] = time.perf_counter() - g.request_start
+    response.headers['Server-Timing'] = ', '.join(
+        '%s;dur=%.3f' % (stage, seconds * 1000) for stage, seconds in totals.items())
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+    if PROFILE_HEADER in request.headers or app.config['PROFILE_QUERY_FLAG']:
+        _start_profile()
+
+@app.after_request
+def _record_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.inc('calculator_requests_total', (route,))
+    metrics.observe('calculator_request_duration_seconds', (route,),
+                    time.perf_counter() - g.request_start)
+    if 'profile_token' in g:
+        _finish_profile(response)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Expression engine
+#
+# Expressions are tokenized and parsed into a small tuple-based AST:
+#   ('num', value, text)
+#   ('neg', operand) / ('pos', operand)
+#   ('bin', op, left, right)   where op is one of + - * / // % **
+#   ('call', name, *arguments) a function from FUNCTIONS, e.g. sqrt(2)
+#   ('var', name)              only in compiled expressions, see bind()
+# Operator precedence and associativity follow Python, which is what the
+# previous eval() based implementation used, so results are unchanged.
+#
+# There is one evaluator per arithmetic mode: 'float' (Python ints and floats,
+# the default), 'decimal' (decimal.Decimal at a requested precision) and
+# 'fraction' (exact fractions.Fraction). Literals keep their source text so
+# the exact modes never go through a binary float.
+
+class ExpressionError(ValueError):
+    pass
+
+class LimitExceeded(ExpressionError):
+    def __init__(self, message, limit):
+        super().__init__(message)
+        self.limit = limit
+
+# Resource budgets for a single expression. They keep inputs like 2^9^9^9
+# from tying up a worker: input length and parse size are bounded up front
+# (the length before anything is tokenized or cached), integer growth is
+# checked before each power/multiplication, and evaluation stops once the
+# timeout (in seconds) has passed. A timeout of None disables the deadline.
+# The default max_int_bits keeps results under Python's 4300 digit limit for
+# converting ints to strings, so every accepted result can be serialized.
+class EvaluationLimits:
+    def __init__(self, max_int_bits=14000, max_exponent=100000, max_depth=100,
+                 max_nodes=2000, max_length=20000, timeout=0.25):
+        self.max_int_bits = max_int_bits
+        self.max_exponent = max_exponent
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_length = max_length
+        self.timeout = timeout
+
+    def deadline(self):
+        if self.timeout is None:
+            return None
+        return time.monotonic() + self.timeout
+
+limits = EvaluationLimits()
+
+def _check_length(expression):
+    if len(expression) > limits.max_length:
+        raise LimitExceeded('Expression too long', 'max_length')
+
+def _check_deadline(deadline):
+    if deadline is not None and time.monotonic() > deadline:
+        raise LimitExceeded('Evaluation timed out', 'timeout')
+
+# Tokenizing is the only validation: one regex scan over the expression in
+# which every character is either whitespace or part of a token, and
+# anything else lands in the last group and is rejected. × ÷ and ^ are
+# normalized as they are read, so no intermediate strings are built, and
+# operator tokens are shared rather than created per occurrence. Digits are
+# ASCII only, as in the old eval() path and the page's engine.
+_TOKEN_RE = re.compile(r'\s*(?:([0-9]+\.?[0-9]*|\.[0-9]+)|(\*\*|//|[-+*/%^(),×÷])|([A-Za-z_][A-Za-z_0-9]*)|(\S))')
+_OPERATOR_TOKENS = {op: ('op', op) for op in ('**', '//', '+', '-', '*', '/', '%', '(', ')', ',')}
+_OPERATOR_TOKENS.update({'^': ('op', '**'), '×': ('op', '*'), '÷': ('op', '/')})
+
+def tokenize(expression):
+    tokens = []
+    append = tokens.append
+    try:
+        for number, op, name, _ in _TOKEN_RE.findall(expression):
+            if op:
+                append(_OPERATOR_TOKENS[op])
+            elif number:
+                append(('num', float(number) if '.' in number else int(number), number))
+            elif name:
+                append(('var', name))
+            else:
+                raise ExpressionError('Invalid expression')
+    except ExpressionError:
+        raise
+    except ValueError:
+        # Integer literals past Python's 4300 digit limit
+        raise ExpressionError('Invalid expression')
+    return tokens
+
+class _Parser:
+    def __init__(self, tokens, variables=True):
+        self.tokens = tokens
+        self.variables = variables
+        self.pos = 0
+        self.depth = 0
+        self.nodes = 0
+
+    def node(self, *parts):
+        self.nodes += 1
+        if self.nodes > limits.max_nodes:
+            raise LimitExceeded('Expression too large', 'max_nodes')
+        return parts
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def take(self, value=None):
+        token = self.peek()
+        if token is None or (value is not None and token != ('op', value)):
+            raise ExpressionError('Invalid expression')
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.expr()
+        if self.peek() is not None:
+            raise ExpressionError('Invalid expression')
+        return node
+
+    # expr := term (('+' | '-') term)*
+    def expr(self):
+        node = self.term()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            op = self.take()[1]
+            node = self.node('bin', op, node, self.term())
+        return node
+
+    # term := factor (('*' | '/' | '//' | '%') factor)*
+    def term(self):
+        node = self.factor()
+        while self.peek() in (('op', '*'), ('op', '/'), ('op', '//'), ('op', '%')):
+            op = self.take()[1]
+            node = self.node('bin', op, node, self.factor())
+        return node
+
+    # factor := ('+' | '-') factor | power
+    def factor(self):
+        # Every level of nesting passes through here
+        self.depth += 1
+        if self.depth > limits.max_depth:
+            raise LimitExceeded('Expression too deeply nested', 'max_depth')
+        token = self.peek()
+        if token == ('op', '-'):
+            self.take()
+            node = self.node('neg', self.factor())
+        elif token == ('op', '+'):
+            self.take()
+            node = self.node('pos', self.factor())
+        else:
+            node = self.power()
+        self.depth -= 1
+        return node
+
+    # power := atom ['**' factor]   (right associative)
+    def power(self):
+        node = self.atom()
+        if self.peek() == ('op', '**'):
+            self.take()
+            node = self.node('bin', '**', node, self.factor())
+        return node
+
+    # atom := NUMBER | NAME '(' expr (',' expr)* ')' | NAME | '(' expr ')'
+    def atom(self):
+        token = self.take()
+        if token[0] == 'num':
+            return self.node(*token)
+        if token[0] == 'var':
+            name = token[1]
+            if self.peek() == ('op', '('):
+                if name not in FUNCTIONS:
+                    raise ExpressionError('Unknown function')
+                self.take()
+                arguments = [self.expr()]
+                while self.peek() == ('op', ','):
+                    self.take()
+                    arguments.append(self.expr())
+                self.take(')')
+                if len(arguments) != FUNCTIONS[name].arity:
+                    raise ExpressionError('Wrong number of arguments for %s' % name)
+                return self.node('call', name, *arguments)
+            if not self.variables:
+                raise ExpressionError('Unknown variable %s' % name)
+            return self.node(*token)
+        if token == ('op', '('):
+            node = self.expr()
+            self.take(')')
+            return node
+        raise ExpressionError('Invalid expression')
+
+def parse(expression, variables=True):
+    _check_length(expression)
+    return _Parser(tokenize(expression), variables).parse()
+
+def _check_power(base, exponent):
+    # base is the magnitude to be raised; base^exponent has
+    # floor(exponent * log2(base)) + 1 bits
+    if abs(exponent) > limits.max_exponent:
+        raise LimitExceeded('Exponent too large', 'max_exponent')
+    if base > 1 and abs(exponent) * math.log2(base) >= limits.max_int_bits:
+        raise LimitExceeded('Result too large', 'max_int_bits')
+
+def _power(base, exponent):
+    if type(base) is int and type(exponent) is int and exponent > 0:
+        _check_power(abs(base), exponent)
+    try:
+        result = base ** exponent
+    except OverflowError:
+        # Past float64's range; fixed by the format, not by EvaluationLimits
+        raise LimitExceeded('Result too large', 'float_range')
+    if isinstance(result, complex):
+        raise ExpressionError('Complex result')
+    return result
+
+def _multiply(a, b):
+    if type(a) is int and type(b) is int and a.bit_length() + b.bit_length() > limits.max_int_bits:
+        raise LimitExceeded('Result too large', 'max_int_bits')
+    return a * b
+
+_BINARY_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': _multiply,
+    '/': operator.truediv,
+    '//': operator.floordiv,
+    '%': operator.mod,
+    '**': _power,
+}
+
+# Functions
+#
+# name(arguments) calls dispatch through FUNCTIONS with a single dict lookup.
+# Each function has an implementation per evaluation mode, plus a NumPy one
+# used for column and /trig value arrays. A mode without an implementation
+# reports an error instead of quietly going through a binary float (sqrt(2)
+# has no exact fraction). Angles are radians inside expressions; trig()
+# converts for the degrees mode of /trig.
+
+class MathFunction:
+    def __init__(self, scalar, vector=None, decimal=None, fraction=None, angle=None, arity=1):
+        self.scalar = scalar
+        self.vector = vector
+        self.decimal = decimal
+        self.fraction = fraction
+        # 'in' when the argument is an angle, 'out' when the result is
+        self.angle = angle
+        self.arity = arity
+
+def _float_function(name, function, domain=None):
+    def run(x):
+        if domain is not None and not domain(x):
+            raise ExpressionError('%s domain error' % name)
+        try:
+            return function(x)
+        except OverflowError:
+            raise ExpressionError('%s range error' % name)
+    return run
+
+def _decimal_function(name, function, domain=None):
+    def run(x):
+        if domain is not None and not domain(x):
+            raise ExpressionError('%s domain error' % name)
+        return function(x)
+    return run
+
+def _decimal_cbrt(x):
+    if not x:
+        return x
+    root = abs(x) ** (decimal.Decimal(1) / 3)
+    return root if x > 0 else -root
+
+# Exact factorials below FACTORIAL_TABLE_SIZE are precomputed (170! is the
+# largest that fits in a float64, which the NumPy path reuses). Past the
+# table math.factorial does the work: CPython computes it by binary
+# splitting over the odd parts in C, which beats a pure-Python prime swing
+# at every size max_int_bits allows. Non-integers go through gamma.
+FACTORIAL_TABLE_SIZE = 171
+_FACTORIALS = [1]
+for _n in range(1, FACTORIAL_TABLE_SIZE):
+    _FACTORIALS.append(_FACTORIALS[-1] * _n)
+
+def _factorial_bits(n):
+    return math.lgamma(n + 1) / math.log(2) if n > 1 else 1
+
+def _comb_bits(n, k):
+    k = min(k, n - k)
+    if n < 2 ** 40:
+        return (math.lgamma(n + 1) - math.lgamma(k + 1) - math.lgamma(n - k + 1)) / math.log(2)
+    # lgamma can't resolve the difference at this size; n^k bounds it from above
+    return k * math.log2(n)
+
+def _as_integer(x):
+    # int(x) when x is integral, otherwise None
+    try:
+        n = int(x)
+    except (OverflowError, ValueError):
+        return None
+    return n if n == x else None
+
+def _exact_factorial(n):
+    # Results over max_int_bits are refused before computing; n! > 2^n
+    if n < FACTORIAL_TABLE_SIZE:
+        return _FACTORIALS[n]
+    if n > limits.max_int_bits or _factorial_bits(n) > limits.max_int_bits:
+        raise LimitExceeded('Result too large', 'max_int_bits')
+    return math.factorial(n)
+
+_gamma_domain = lambda x: x > 0 or x != math.floor(x)
+_gamma = _float_function('gamma', math.gamma, _gamma_domain)
+
+def _factorial(x):
+    # n! exactly for non-negative integers, gamma(x + 1) for other reals
+    n = _as_integer(x)
+    if n is None:
+        return _gamma(x + 1)
+    if n < 0:
+        raise ExpressionError('factorial domain error')
+    return _exact_factorial(n)
+
+def _exact_mode_factorial(mode, number):
+    def factorial(x):
+        n = _as_integer(x)
+        if n is None:
+            raise ExpressionError('factorial of a non-integer is not available in %s mode' % mode)
+        if n < 0:
+            raise ExpressionError('factorial domain error')
+        return number(_exact_factorial(n))
+    return factorial
+
+def _comb(n, k):
+    n, k = _as_integer(n), _as_integer(k)
+    if n is None or k is None or n < 0 or k < 0:
+        raise ExpressionError('comb domain error')
+    if k > n:
+        return 0
+    if _comb_bits(n, k) > limits.max_int_bits:
+        raise LimitExceeded('Result too large', 'max_int_bits')
+    return math.comb(n, k)
+
+def _reciprocal(x):
+    if x == 0:
+        raise ExpressionError('division by zero')
+    return 1 / x
+
+_positive = lambda x: x > 0
+_non_negative = lambda x: x >= 0
+_unit_interval = lambda x: -1 <= x <= 1
+
+FUNCTIONS = {
+    'sqrt': MathFunction(_float_function('sqrt', math.sqrt, _non_negative),
+                         decimal=_decimal_function('sqrt', decimal.Decimal.sqrt, _non_negative)),
+    'cbrt': MathFunction(_float_function('cbrt', math.cbrt), decimal=_decimal_cbrt),
+    'ln': MathFunction(_float_function('ln', math.log, _positive),
+                       decimal=_decimal_function('ln', decimal.Decimal.ln, _positive)),
+    'log10': MathFunction(_float_function('log10', math.log10, _positive),
+                          decimal=_decimal_function('log10', decimal.Decimal.log10, _positive)),
+    'exp': MathFunction(_float_function('exp', math.exp), decimal=decimal.Decimal.exp),
+    'factorial': MathFunction(_factorial,
+                              decimal=_exact_mode_factorial('decimal', lambda n: decimal.getcontext().create_decimal(n)),
+                              fraction=_exact_mode_factorial('fraction', lambda n: fractions.Fraction(n))),
+    'gamma': MathFunction(_gamma),
+    'lgamma': MathFunction(_float_function('lgamma', math.lgamma, _gamma_domain)),
+    'comb': MathFunction(_comb,
+                         decimal=lambda n, k: decimal.getcontext().create_decimal(_comb(n, k)),
+                         fraction=lambda n, k: fractions.Fraction(_comb(n, k)),
+                         arity=2),
+    'reciprocal': MathFunction(_reciprocal, decimal=_reciprocal, fraction=_reciprocal),
+    'abs': MathFunction(abs, decimal=abs, fraction=abs),
+    'sin': MathFunction(_float_function('sin', math.sin), angle='in'),
+    'cos': MathFunction(_float_function('cos', math.cos), angle='in'),
+    'tan': MathFunction(_float_function('tan', math.tan), angle='in'),
+    'asin': MathFunction(_float_function('asin', math.asin, _unit_interval), angle='out'),
+    'acos': MathFunction(_float_function('acos', math.acos, _unit_interval), angle='out'),
+    'atan': MathFunction(_float_function('atan', math.atan), angle='out'),
+}
+
+def _register_vector_functions(np):
+    # Called by load_numpy() with the freshly imported module
+    global _VECTOR_OPS
+    float_factorials = np.array(_FACTORIALS, dtype=np.float64)
+    
+    def vectorize(function):
+        # Element by element, for functions without a NumPy ufunc; values
+        # the function rejects become NaN
+        def element(*values):
+            try:
+                return float(function(*values))
+            except (ArithmeticError, ValueError):
+                return math.nan
+        return np.vectorize(element, otypes=[np.float64])
+    
+    vector_gamma = vectorize(math.gamma)
+    
+    def vector_factorial(x):
+        x = np.asarray(x, dtype=np.float64)
+        result = np.full(x.shape, np.nan)
+        integral = x == np.floor(x)
+        table = integral & (x >= 0) & (x < FACTORIAL_TABLE_SIZE)
+        result[table] = float_factorials[x[table].astype(np.intp)]
+        fractional = ~integral & np.isfinite(x)
+        result[fractional] = vector_gamma(x[fractional] + 1)
+        return result
+    
+    for name, vector in (('sqrt', np.sqrt), ('cbrt', np.cbrt), ('ln', np.log),
+                         ('log10', np.log10), ('exp', np.exp), ('factorial', vector_factorial),
+                         ('gamma', vector_gamma), ('lgamma', vectorize(math.lgamma)),
+                         ('comb', vectorize(_comb)),
+                         ('reciprocal', lambda x: np.true_divide(1.0, x)), ('abs', np.abs),
+                         ('sin', np.sin), ('cos', np.cos), ('tan', np.tan),
+                         ('asin', np.arcsin), ('acos', np.arccos), ('atan', np.arctan)):
+        FUNCTIONS[name].vector = vector
+    
+    _VECTOR_OPS = {
+        '+': np.add,
+        '-': np.subtract,
+        '*': np.multiply,
+        '/': np.true_divide,
+        '//': np.floor_divide,
+        '%': np.mod,
+        '**': np.power,
+    }
+
+def _mode_functions(mode):
+    return {name: getattr(function, mode) for name, function in FUNCTIONS.items()
+            if getattr(function, mode) is not None}
+
+def _left_chain(node):
+    # Splits a 'bin' node into its leftmost operand and the 'bin' nodes
+    # applied to it, innermost first. Tree walks loop over the chain so
+    # that 1+1+...+1 recurses only as deep as its nesting, not once per
+    # operator.
+    links = []
+    while node[0] == 'bin':
+        links.append(node)
+        node = node[2]
+    links.reverse()
+    return node, links
+
+def evaluate(node, deadline=None):
+    kind = node[0]
+    if kind == 'num':
+        return node[1]
+    if kind == 'bin':
+        operand, links = _left_chain(node)
+        value = evaluate(operand, deadline)
+        for link in links:
+            _check_deadline(deadline)
+            value = _BINARY_OPS[link[1]](value, evaluate(link[3], deadline))
+        return value
+    if kind == 'call':
+        return FUNCTIONS[node[1]].scalar(*[evaluate(argument, deadline) for argument in node[2:]])
+    if kind == 'neg':
+        return -evaluate(node[1], deadline)
+    return +evaluate(node[1], deadline)
+
+EVALUATION_MODES = ('float', 'decimal', 'fraction')
+DECIMAL_PRECISION = 28
+MAX_DECIMAL_PRECISION = 1000
+
+def _make_evaluator(mode, number, ops):
+    functions = _mode_functions(mode)
+    
+    def run(node, deadline=None):
+        kind = node[0]
+        if kind == 'num':
+            return number(node[2])
+        if kind == 'bin':
+            operand, links = _left_chain(node)
+            value = run(operand, deadline)
+            for link in links:
+                _check_deadline(deadline)
+                value = ops[link[1]](value, run(link[3], deadline))
+            return value
+        if kind == 'call':
+            function = functions.get(node[1])
+            if function is None:
+                raise ExpressionError('%s is not available in %s mode' % (node[1], mode))
+            return function(*[run(argument, deadline) for argument in node[2:]])
+        if kind == 'neg':
+            return -run(node[1], deadline)
+        return +run(node[1], deadline)
+    return run
+
+# Decimal's // and % truncate towards zero; use floor semantics like the
+# other modes so results only differ in precision, not in meaning.
+def _decimal_mod(a, b):
+    if not b:
+        raise ExpressionError('division by zero')
+    result = a % b
+    if result and (result < 0) != (b < 0):
+        result += b
+    return result
+
+def _decimal_floordiv(a, b):
+    return (a - _decimal_mod(a, b)) / b
+
+# Decimal(0) ** -1 is Infinity without signalling DivisionByZero
+def _decimal_power(a, b):
+    if not a and b < 0:
+        raise ExpressionError('division by zero')
+    return a ** b
+
+_evaluate_decimal = _make_evaluator('decimal', decimal.Decimal, {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '//': _decimal_floordiv,
+    '%': _decimal_mod,
+    '**': _decimal_power,
+})
+
+def evaluate_decimal(node, precision=DECIMAL_PRECISION, deadline=None):
+    context = decimal.Context(
+        prec=precision,
+        traps=[decimal.InvalidOperation, decimal.DivisionByZero, decimal.Overflow],
+    )
+    try:
+        with decimal.localcontext(context):
+            result = _evaluate_decimal(node, deadline)
+    except (decimal.DivisionByZero, decimal.DivisionUndefined):
+        raise ExpressionError('division by zero')
+    except decimal.Overflow:
+        raise ExpressionError('Result too large')
+    except decimal.InvalidOperation:
+        raise ExpressionError('Invalid operation')
+    if not result.is_finite():
+        raise ExpressionError('Result too large')
+    return result
+
+def _fraction_power(base, exponent):
+    if exponent.denominator != 1:
+        raise ExpressionError('Non-integer exponent in fraction mode')
+    exponent = exponent.numerator
+    _check_power(max(abs(base.numerator), base.denominator), exponent)
+    if base == 0 and exponent < 0:
+        raise ExpressionError('division by zero')
+    return base ** exponent
+
+def _fraction_multiply(a, b):
+    bits = max(a.numerator.bit_length() + b.numerator.bit_length(),
+               a.denominator.bit_length() + b.denominator.bit_length())
+    if bits > limits.max_int_bits:
+        raise LimitExceeded('Result too large', 'max_int_bits')
+    return a * b
+
+def _fraction_div(op):
+    def div(a, b):
+        if b == 0:
+            raise ExpressionError('division by zero')
+        return op(a, b)
+    return div
+
+# fractions is imported, and the evaluator built, the first time fraction
+# mode is used
+fractions = None
+_evaluate_fraction = None
+
+def evaluate_fraction(node, deadline=None):
+    global fractions, _evaluate_fraction
+    if _evaluate_fraction is None:
+        import fractions
+        _evaluate_fraction = _make_evaluator('fraction', fractions.Fraction, {
+            '+': operator.add,
+            '-': operator.sub,
+            '*': _fraction_multiply,
+            '/': _fraction_div(operator.truediv),
+            '//': _fraction_div(operator.floordiv),
+            '%': _fraction_div(operator.mod),
+            '**': _fraction_power,
+        })
+    return _evaluate_fraction(node, deadline)
+
+# Cost estimation
+#
+# estimate_cost() predicts the time needed to evaluate an AST without running
+# it, in rough microseconds. Integer (and exact rational) sizes are tracked in
+# bits through the tree, so 7^4000 * 3^4000 is recognised as two large powers
+# and a large multiplication up front. Float arithmetic is constant time;
+# decimal arithmetic scales with the precision. Coefficients were fitted
+# against CPython 3.11 timings, e.g. 3^8000 (~30us) and a non-integer decimal
+# power (~80us at 28 digits, ~30ms at 1000).
+
+def _words(bits):
+    return bits / 64.0 + 1
+
+def _estimate(node, exact):
+    # Returns (cost, bits, is_float) for a subtree
+    kind = node[0]
+    if kind == 'num':
+        if exact:
+            # Building a Fraction from text is far slower than an int literal
+            return 8, len(node[2]) * 10 // 3 + 1, False
+        if type(node[1]) is float:
+            return 1, 53, True
+        return 1, node[1].bit_length(), False
+    if kind == 'call':
+        return _estimate_call(node, exact)
+    if kind != 'bin':
+        return _estimate(node[1], exact)
+    
+    operand, links = _left_chain(node)
+    estimate = _estimate(operand, exact)
+    for link in links:
+        estimate = _estimate_bin(link[1], estimate, _estimate(link[3], exact), link[3], exact)
+    return estimate
+
+def _estimate_bin(op, left, right, exponent, exact):
+    # Combines the estimates for the two sides of an operator; exponent is
+    # the right-hand node
+    left_cost, left_bits, left_float = left
+    right_cost, right_bits, right_float = right
+    cost = left_cost + right_cost + 1
+    if left_float or right_float or (op == '/' and not exact):
+        return cost, 53, True
+    if exact:
+        # Every rational operation normalizes with a gcd
+        cost += _words(left_bits + right_bits) ** 2 / 150
+    
+    if op in ('+', '-'):
+        bits = max(left_bits, right_bits) + 1
+        return cost + _words(bits) / 150, bits, False
+    if op in ('*', '/'):
+        bits = left_bits + right_bits
+        return cost + max(_words(left_bits), _words(right_bits)) ** 1.585 / 150, bits, False
+    if op in ('//', '%'):
+        return cost + _words(left_bits) * _words(right_bits) / 150, left_bits, False
+    
+    # Powers: a literal exponent is known exactly, a computed one is bounded
+    # by its size. Anything over the int limit is rejected before computing.
+    if exponent[0] == 'num' and type(exponent[1]) is int:
+        exponent = exponent[1]
+    else:
+        exponent = 2 ** min(right_bits, 24)
+    if exponent < 0:
+        return cost, 53, not exact
+    if (left_bits - 1) * exponent > limits.max_int_bits:
+        return cost, limits.max_int_bits, False
+    bits = min(left_bits * exponent, limits.max_int_bits)
+    return cost + 2 * _words(bits) ** 1.585 / 150, bits, False
+
+def _estimate_call(node, exact):
+    name, arguments = node[1], node[2:]
+    cost = 1
+    bits, is_float = 53, True
+    for argument in arguments:
+        argument_cost, bits, is_float = _estimate(argument, exact)
+        cost += argument_cost
+    if name == 'abs':
+        return cost, bits, is_float
+    if name == 'reciprocal':
+        return cost, bits, is_float or not exact
+    if name in ('factorial', 'comb'):
+        # Exact for integer literals; a computed argument could be anything
+        # up to the int limit
+        literals = [argument[1] for argument in arguments
+                    if argument[0] == 'num' and type(argument[1]) is int]
+        if len(literals) < len(arguments):
+            bits = limits.max_int_bits
+        elif name == 'factorial':
+            bits = _factorial_bits(min(literals[0], limits.max_int_bits + 1))
+        elif literals[1] > literals[0] or min(literals) < 0:
+            bits = 1
+        else:
+            bits = _comb_bits(*literals)
+        bits = min(int(bits) + 1, limits.max_int_bits)
+        return cost + 2 * _words(bits) ** 1.585 / 150, bits, False
+    return cost, 53, True
+
+def _estimate_decimal(node, precision):
+    kind = node[0]
+    if kind == 'num':
+        return 1
+    if kind == 'call':
+        cost = 1 + (precision / 100.0) ** 1.585
+        for argument in node[2:]:
+            cost += _estimate_decimal(argument, precision)
+        if node[1] not in ('abs', 'reciprocal', 'factorial', 'comb'):
+            # Roots, logarithms and exp go through ln/exp like non-integer powers
+            cost += 80 * (precision / 28.0) ** 1.7
+        return cost
+    if kind != 'bin':
+        return _estimate_decimal(node[1], precision)
+    operand, links = _left_chain(node)
+    cost = _estimate_decimal(operand, precision)
+    for link in links:
+        cost += _estimate_decimal(link[3], precision) + 1 + (precision / 100.0) ** 1.585
+        exponent = link[3]
+        if link[1] == '**' and not (exponent[0] == 'num' and type(exponent[1]) is int):
+            # Non-integer powers go through ln/exp
+            cost += 80 * (precision / 28.0) ** 1.7
+    return cost
+
+def estimate_cost(node, mode='float', precision=DECIMAL_PRECISION):
+    if mode == 'decimal':
+        return _estimate_decimal(node, precision)
+    cost, _, _ = _estimate(node, exact=(mode == 'fraction'))
+    return cost
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    if app.config['API_ONLY']:
+        abort(404)
+    return _asset_response(ui_assets()['index.html'])
+
+@app.route('/assets/<name>')
+def fingerprinted_asset(name):
+    if app.config['API_ONLY']:
+        abort(404)
+    asset = ui_assets().get(name)
+    if asset is None or not asset.immutable:
+        abort(404)
+    return _asset_response(asset)
+
+# Expression cache
+#
+# Maps an expression's normalized tokens to (ast, payload), so 2×3 and 2*3
+# share an entry. The payload is the response
+# body for that expression and is reused as-is on later requests; it is None
+# when the outcome can't be reused, in which case only the parse is skipped.
+
+EXPRESSION_CACHE_SIZE = 4096
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+expression_cache = LRUCache(EXPRESSION_CACHE_SIZE)
+
+def _evaluate_payload(node, mode='float', precision=DECIMAL_PRECISION):
+    deadline = limits.deadline()
+    if mode == 'decimal':
+        # Exact modes return strings so clients don't lose precision
+        return {'success': True, 'result': str(evaluate_decimal(node, precision, deadline))}
+    if mode == 'fraction':
+        return {'success': True, 'result': str(evaluate_fraction(node, deadline))}
+    
+    result = evaluate(node, deadline)
+    
+    # Round to avoid floating point errors
+    if isinstance(result, float):
+        result = round(result, 10)
+    
+    return {'success': True, 'result': result}
+
+def _check_mode(mode, precision):
+    if mode not in EVALUATION_MODES:
+        raise ExpressionError('Unknown mode')
+    if mode == 'decimal' and not (type(precision) is int and 0 < precision <= MAX_DECIMAL_PRECISION):
+        raise ExpressionError('Invalid precision')
+
+# Offloading
+#
+# Expressions whose estimated cost is above OFFLOAD_COST are evaluated on a
+# pool of worker processes, so a single huge power can't hold the GIL and
+# stall every other request in the process. Cheap ones (nearly all traffic)
+# are evaluated inline, where a process hop would cost more than the work.
+# The pool is shared by the Flask views and asgi_app, and is created and
+# warmed per process on first use (or by warm_offload_pool() after fork).
+
+OFFLOAD_COST = 1000
+OFFLOAD_POOL_SIZE = int(os.environ.get('CALCULATOR_OFFLOAD_POOL_SIZE') or os.cpu_count() or 1)
+# Expensive expressions waiting for or running in the pool; further ones
+# wait before queueing more work
+OFFLOAD_MAX_PENDING = 64
+
+class TierStats:
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            if seconds > self.max_seconds:
+                self.max_seconds = seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                'count': self.count,
+                'total_seconds': self.total_seconds,
+                'mean_seconds': self.total_seconds / self.count if self.count else 0.0,
+                'max_seconds': self.max_seconds,
+            }
+
+tier_stats = {'inline': TierStats(), 'offload': TierStats()}
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_offload_slots = threading.BoundedSemaphore(OFFLOAD_MAX_PENDING)
+_offload_pending = 0
+_offload_pending_lock = threading.Lock()
+
+def _noop():
+    pass
+
+def warm_offload_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            import concurrent.futures
+            _process_pool = concurrent.futures.ProcessPoolExecutor(OFFLOAD_POOL_SIZE)
+            # Start every worker now rather than on the first expensive request
+            for future in [_process_pool.submit(_noop) for _ in range(OFFLOAD_POOL_SIZE)]:
+                future.result()
+    return _process_pool
+
+def shutdown_offload_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(cancel_futures=True)
+            _process_pool = None
+
+def _track_pending(delta):
+    global _offload_pending
+    with _offload_pending_lock:
+        _offload_pending += delta
+
+def offload_stats():
+    return {
+        'pool_size': OFFLOAD_POOL_SIZE,
+        'queue_depth': _offload_pending,
+        'tiers': {tier: stats.stats() for tier, stats in tier_stats.items()},
+    }
+
+def settle(node, mode='float', precision=DECIMAL_PRECISION):
+    # Evaluate a parsed expression into (payload, cacheable) without raising;
+    # this is what runs in the pool workers
+    try:
+        return _evaluate_payload(node, mode, precision), True
+    except LimitExceeded as e:
+        # Timeouts depend on load, so only the parse is worth keeping
+        return {'success': False, 'error': str(e), 'limit': e.limit}, e.limit != 'timeout'
+    except (MemoryError, RecursionError) as e:
+        # Resource failures depend on the process state, not the expression
+        return {'success': False, 'error': str(e)}, False
+    except Exception as e:
+        return {'success': False, 'error': str(e)}, True
+
+# Pickling recurses once per level of the AST, so ASTs go to the pool
+# flattened into postfix order and are rebuilt there
+
+def flatten(node, items=None):
+    items = [] if items is None else items
+    kind = node[0]
+    if kind == 'bin':
+        operand, links = _left_chain(node)
+        flatten(operand, items)
+        for link in links:
+            flatten(link[3], items)
+            items.append(('bin', link[1]))
+    elif kind == 'call':
+        for argument in node[2:]:
+            flatten(argument, items)
+        items.append(('call', node[1], len(node) - 2))
+    elif kind in ('neg', 'pos'):
+        flatten(node[1], items)
+        items.append((kind,))
+    else:
+        items.append(node)
+    return items
+
+def unflatten(items):
+    stack = []
+    for item in items:
+        kind = item[0]
+        if kind == 'bin':
+            right = stack.pop()
+            stack[-1] = ('bin', item[1], stack[-1], right)
+        elif kind == 'call':
+            start = len(stack) - item[2]
+            stack[start:] = [('call', item[1]) + tuple(stack[start:])]
+        elif kind in ('neg', 'pos'):
+            stack[-1] = (kind, stack[-1])
+        else:
+            stack.append(item)
+    return stack[0]
+
+def settle_flat(items, mode='float', precision=DECIMAL_PRECISION):
+    return settle(unflatten(items), mode, precision)
+
+def prepare(expression, mode='float', precision=DECIMAL_PRECISION):
+    # Parse an expression, going through the cache. Returns (key, node,
+    # payload): payload is set when the response is already known, otherwise
+    # node still has to be evaluated.
+    
+    start = time.perf_counter()
+    if not isinstance(expression, str):
+        return None, None, {'success': False, 'error': 'Invalid expression'}
+    if len(expression) > limits.max_length:
+        # Not cached, so oversized inputs can't crowd the cache
+        return None, None, {'success': False, 'error': 'Expression too long', 'limit': 'max_length'}
+    
+    # Tokenizing validates and normalizes in the same pass. Inputs it
+    # rejects aren't cached, they fail just as fast again.
+    try:
+        tokens = tuple(tokenize(expression))
+    except ExpressionError as e:
+        return None, None, {'success': False, 'error': str(e)}
+    
+    # The float path is keyed on the tokens alone; other modes also on the
+    # mode and precision
+    if mode == 'float':
+        key = tokens
+    else:
+        key = (mode, precision if mode == 'decimal' else None, tokens)
+    
+    entry = expression_cache.get(key)
+    if entry is not None:
+        return (key,) + entry
+    
+    try:
+        node = _Parser(tokens, variables=False).parse()
+        _observe_stage('parse', start)
+        return key, node, None
+    except LimitExceeded as e:
+        payload = {'success': False, 'error': str(e), 'limit': e.limit}
+    except (MemoryError, RecursionError) as e:
+        return key, None, {'success': False, 'error': str(e)}
+    except Exception as e:
+        payload = {'success': False, 'error': str(e)}
+    expression_cache.put(key, (None, payload))
+    return key, None, payload
+
+def store(key, node, outcome):
+    payload, cacheable = outcome
+    expression_cache.put(key, (node, payload if cacheable else None))
+    return payload
+
+def _pool_failed(pool):
+    # A worker that dies (OOM kill, segfault) breaks the whole pool. Drop it
+    # so that the next expensive expression starts a fresh one.
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+    # The failure says nothing about the expression, so it isn't cached
+    return {'success': False, 'error': 'Evaluation worker crashed'}, False
+
+def _offload(node, mode, precision):
+    pool = warm_offload_pool()
+    from concurrent.futures.process import BrokenProcessPool
+    _track_pending(1)
+    try:
+        with _offload_slots:
+            return pool.submit(settle_flat, flatten(node), mode, precision).result()
+    except BrokenProcessPool:
+        return _pool_failed(pool)
+    finally:
+        _track_pending(-1)
+
+def dispatch(node, mode='float', precision=DECIMAL_PRECISION):
+    # Evaluate inline or in the pool depending on the estimated cost
+    start = time.perf_counter()
+    if estimate_cost(node, mode, precision) > OFFLOAD_COST:
+        tier = 'offload'
+        outcome = _offload(node, mode, precision)
+    else:
+        tier = 'inline'
+        outcome = settle(node, mode, precision)
+    tier_stats[tier].record(_observe_stage('evaluate', start) - start)
+    return outcome
+
+def calculate(expression, mode='float', precision=DECIMAL_PRECISION):
+    key, node, payload = prepare(expression, mode, precision)
+    if payload is not None:
+        return payload
+    return store(key, node, dispatch(node, mode, precision))
+
+def _mode_options(data):
+    mode = data.get('mode', 'float')
+    precision = data.get('precision', DECIMAL_PRECISION)
+    _check_mode(mode, precision)
+    return mode, precision
 
 @app.route('/calculate', methods=['POST'])
 def calculate_expression():
     try:
         data = request.json
         expression = data.get('expression', '')
-        
-        # Validate expression to prevent code injection
-        if not re.match(r'^[\d.+\-*/%()^\s]+$', expression):
-            return jsonify({'success': False, 'error': 'Invalid expression'})
-        
-        # Replace × and ÷ with * and /
-        expression = expression.replace('×', '*').replace('÷', '/')
-        # Replace ^ with **
-        expression = expression.replace('^', '**')
-        # Handle modulo
-        expression = expression.replace('%', '%')
-        
-        # Evaluate the expression safely
-        result = eval(expression)
-        
-        # Round to avoid floating point errors
-        if isinstance(result, float):
-            result = round(result, 10)
-        
-        return jsonify({'success': True, 'result': result})
+        mode, precision = _mode_options(data)
+        return _json_response(calculate(expression, mode, precision))
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        return _json_response({'success': False, 'error': str(e)})
 
-@app.route('/trig', methods=['POST'])
-def trigonometric_function():
+MAX_BATCH_SIZE = 10000
+
+@app.route('/calculate/batch', methods=['POST'])
+def calculate_batch():
     try:
         data = request.json
-        func = data.get('function', '')
-        value = data.get('value', 0)
-        mode = data.get('mode', 'degrees')
-        
-        result = None
-        
-        # Convert to radians if mode is degrees
-        if mode == 'degrees':
-            rad_value = math.radians(value)
+        # Accept either a bare list or {"expressions": [...]}
+        if isinstance(data, list):
+            expressions, mode, precision = data, 'float', DECIMAL_PRECISION
         else:
-            rad_value = value
-        
-        if func == 'sin':
-            result = math.sin(rad_value)
-        elif func == 'cos':
-            result = math.cos(rad_value)
-        elif func == 'tan':
-            result = math.tan(rad_value)
-        elif func == 'asin':
-            if -1 <= value <= 1:
-                result = math.degrees(math.asin(value)) if mode == 'degrees' else math.asin(value)
-            else:
-                return jsonify({'success': False, 'error': 'asin domain error'})
-        elif func == 'acos':
-            if -1 <= value <= 1:
-                result = math.degrees(math.acos(value)) if mode == 'degrees' else math.acos(value)
+            expressions = data.get('expressions', [])
+            mode, precision = _mode_options(data)
+        if not isinstance(expressions, list):
+            return _json_response({'success': False, 'error': 'Expected a list of expressions'})
+        if len(expressions) > MAX_BATCH_SIZE:
+            return _json_response({'success': False, 'error': 'Too many expressions'})
+        
+        # Identical expressions in the batch are only evaluated once
+        seen = {}
+        results = []
+        for expression in expressions:
+            if not isinstance(expression, str):
+                results.append({'success': False, 'error': 'Invalid expression'})
+                continue
+            payload = seen.get(expression)
+            if payload is None:
+                payload = seen[expression] = calculate(expression, mode, precision)
+            results.append(payload)
+        
+        format = bulk_format()
+        if format != 'application/json' and mode == 'float':
+            return _bulk_response(format, [('results', _batch_values(results))])
+        return _json_response({'success': True, 'results': results})
+    except Exception as e:
+        return _json_response({'success': False, 'error': str(e)})
+
+def _batch_values(results):
+    values = np.full(len(results), np.nan)
+    for i, payload in enumerate(results):
+        if payload['success']:
+            try:
+                values[i] = payload['result']
+            except OverflowError:
+                # Integers beyond float64 are only exact as JSON
+                pass
+    return values
+
+MAX_STREAM_LINE = 65536
+
+def _stream_lines(stream):
+    # Yield lines from the request body without ever holding more than one
+    # (bounded) line in memory. Over-long lines are drained and yielded as None.
+    while True:
+        line = stream.readline(MAX_STREAM_LINE)
+        if not line:
+            return
+        if len(line) == MAX_STREAM_LINE and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(MAX_STREAM_LINE)
+            yield None
+            continue
+        yield line
+
+@app.route('/calculate/stream', methods=['POST'])
+def calculate_stream():
+    # Options come from the query string since the body is the expressions
+    try:
+        mode = request.args.get('mode', 'float')
+        precision = request.args.get('precision')
+        if precision is None:
+            precision = DECIMAL_PRECISION
+        elif precision.isascii() and precision.isdigit():
+            precision = int(precision)
+        _check_mode(mode, precision)
+    except ExpressionError as e:
+        return _json_response({'success': False, 'error': str(e)})
+    
+    def generate():
+        for line in _stream_lines(request.stream):
+            if line is None:
+                payload = {'success': False, 'error': 'Expression too long'}
             else:
-                return jsonify({'success': False, 'error': 'acos domain error'})
-        elif func == 'atan':
-            result = math.degrees(math.atan(value)) if mode == 'degrees' else math.atan(value)
+                try:
+                    payload = calculate(line.decode('utf-8').rstrip('\r\n'), mode, precision)
+                except Exception as e:
+                    payload = {'success': False, 'error': str(e)}
+            yield encode_payload(payload)[1]
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/calculate/pool', methods=['GET'])
+def calculate_pool_stats():
+    return jsonify(offload_stats())
+
+@app.route('/calculate/cache', methods=['GET'])
+def calculate_cache_stats():
+    return jsonify(expression_cache.stats())
+
+# Compiled expressions
+#
+# POST /compile parses an expression with named variables (a*x^2+b*x+c) once
+# and returns a handle; POST /evaluate then runs it against variable values
+# without parsing again. Bindings are substituted into the AST as literals,
+# so every evaluation mode, limit and the offload pool work as for
+# /calculate. Column bindings (lists of values, one per row) are evaluated
+# in bulk: in float mode with NumPy that is one float64 array operation per
+# AST node, and rows that fail or overflow come back as null.
+#
+# Handles are a hash of the expression text and compiled expressions
+# are kept per process in an LRU. A worker that doesn't know a handle (after
+# eviction, or under gunicorn with several workers) compiles the expression
+# given alongside it, so clients should send both.
+
+COMPILED_CACHE_SIZE = 1024
+MAX_EVALUATE_ROWS = 100000
+
+class CompiledExpression:
+    def __init__(self, expression, node, variables):
+        self.expression = expression
+        self.node = node
+        self.variables = variables
+
+compiled_expressions = LRUCache(COMPILED_CACHE_SIZE)
+
+def _variables(node, names):
+    kind = node[0]
+    if kind == 'var':
+        names.add(node[1])
+    elif kind == 'bin':
+        operand, links = _left_chain(node)
+        _variables(operand, names)
+        for link in links:
+            _variables(link[3], names)
+    elif kind == 'call':
+        for argument in node[2:]:
+            _variables(argument, names)
+    elif kind != 'num':
+        _variables(node[1], names)
+    return names
+
+def compile_expression(expression):
+    # Returns (handle, compiled); parse errors propagate
+    _check_length(expression)
+    handle = hashlib.sha256(expression.encode('utf-8')).hexdigest()[:16]
+    compiled = compiled_expressions.get(handle)
+    if compiled is None:
+        node = parse(expression)
+        compiled = CompiledExpression(expression, node, sorted(_variables(node, set())))
+        compiled_expressions.put(handle, compiled)
+    return handle, compiled
+
+def _literal(name, value):
+    if type(value) is not int and (type(value) is not float or not math.isfinite(value)):
+        raise ExpressionError('Invalid value for %s' % name)
+    return ('num', value, repr(value))
+
+def bind(node, literals):
+    # Substitute ('num', ...) literals for the variables in an AST
+    kind = node[0]
+    if kind == 'num':
+        return node
+    if kind == 'var':
+        return literals[node[1]]
+    if kind == 'bin':
+        operand, links = _left_chain(node)
+        node = bind(operand, literals)
+        for link in links:
+            node = (kind, link[1], node, bind(link[3], literals))
+        return node
+    if kind == 'call':
+        return (kind, node[1]) + tuple(bind(argument, literals) for argument in node[2:])
+    return (kind, bind(node[1], literals))
+
+def evaluate_bindings(compiled, bindings, mode='float', precision=DECIMAL_PRECISION):
+    try:
+        if not isinstance(bindings, dict):
+            raise ExpressionError('Expected an object of variable values')
+        literals = {}
+        for name in compiled.variables:
+            if name not in bindings:
+                raise ExpressionError('Missing value for %s' % name)
+            literals[name] = _literal(name, bindings[name])
+    except ExpressionError as e:
+        return {'success': False, 'error': str(e)}
+    payload, _ = dispatch(bind(compiled.node, literals), mode, precision)
+    return payload
+
+# _VECTOR_OPS is set up by load_numpy()
+_VECTOR_OPS = None
+
+def _evaluate_vector(node, columns, deadline):
+    kind = node[0]
+    if kind == 'num':
+        return float(node[1])
+    if kind == 'var':
+        return columns[node[1]]
+    if kind == 'bin':
+        operand, links = _left_chain(node)
+        value = _evaluate_vector(operand, columns, deadline)
+        for link in links:
+            _check_deadline(deadline)
+            value = _VECTOR_OPS[link[1]](value, _evaluate_vector(link[3], columns, deadline))
+        return value
+    if kind == 'call':
+        return FUNCTIONS[node[1]].vector(*[_evaluate_vector(argument, columns, deadline)
+                                           for argument in node[2:]])
+    if kind == 'neg':
+        return np.negative(_evaluate_vector(node[1], columns, deadline))
+    return _evaluate_vector(node[1], columns, deadline)
+
+def _column_rows(compiled, columns):
+    # Validate column bindings and return the number of rows
+    if not isinstance(columns, dict):
+        raise ExpressionError('Expected an object of variable values')
+    rows = None
+    for name in compiled.variables:
+        if name not in columns:
+            raise ExpressionError('Missing value for %s' % name)
+        if isinstance(columns[name], list):
+            if rows is not None and len(columns[name]) != rows:
+                raise ExpressionError('Columns must have the same length')
+            rows = len(columns[name])
+    if rows is None:
+        rows = 1
+    if rows > MAX_EVALUATE_ROWS:
+        raise ExpressionError('Too many rows')
+    return rows
+
+def _vector_columns(compiled, columns, rows):
+    # Float mode column evaluation with NumPy; returns a float64 array
+    arrays = {}
+    for name in compiled.variables:
+        value = columns[name]
+        if isinstance(value, list):
+            for item in value:
+                _literal(name, item)
         else:
-            return jsonify({'success': False, 'error': 'Unknown function'})
-        
-        # Round to avoid floating point errors
-        result = round(result, 10)
-        
-        return jsonify({'success': True, 'result': result})
+            _literal(name, value)
+        arrays[name] = np.asarray(value, dtype=np.float64)
+    with np.errstate(all='ignore'):
+        result = _evaluate_vector(compiled.node, arrays, limits.deadline())
+    return np.round(np.broadcast_to(result, (rows,)), 10)
+
+def evaluate_columns(compiled, columns, mode='float', precision=DECIMAL_PRECISION):
+    # Evaluate a compiled expression for every row of the column bindings.
+    # Scalar bindings apply to all rows. Returns a list with one result (or
+    # None) per row.
+    rows = _column_rows(compiled, columns)
+    if mode == 'float' and load_numpy() is not None:
+        result = _vector_columns(compiled, columns, rows)
+        # NaN and infinities are not valid JSON, report them as null
+        return [value if math.isfinite(value) else None for value in result.tolist()]
+    
+    results = []
+    for row in range(rows):
+        bindings = {name: value[row] if isinstance(value, list) else value
+                    for name, value in columns.items()}
+        payload = evaluate_bindings(compiled, bindings, mode, precision)
+        results.append(payload['result'] if payload['success'] else None)
+    return results
+
+@app.route('/compile', methods=['POST'])
+def compile_endpoint():
+    try:
+        data = request.json
+        expression = data.get('expression', '')
+        if not isinstance(expression, str):
+            return _json_response({'success': False, 'error': 'Invalid expression'})
+        start = time.perf_counter()
+        handle, compiled = compile_expression(expression)
+        _observe_stage('parse', start)
+        return _json_response({'success': True, 'handle': handle, 'variables': compiled.variables})
+    except Exception as e:
+        return _json_response({'success': False, 'error': str(e)})
+
+@app.route('/evaluate', methods=['POST'])
+def evaluate_endpoint():
+    # {"handle": ..., "expression": ..., and one of
+    #   "bindings": {"x": 2}            one result
+    #   "bindings": [{"x": 1}, ...]     one payload per binding, like /calculate/batch
+    #   "columns": {"x": [1, 2, ...]}   one value (or null) per row}
+    try:
+        data = request.json
+        mode, precision = _mode_options(data)
+        compiled = compiled_expressions.get(data.get('handle'))
+        if compiled is None:
+            expression = data.get('expression')
+            if not isinstance(expression, str):
+                return _json_response({'success': False, 'error': 'Unknown handle'})
+            _, compiled = compile_expression(expression)
+        
+        if 'columns' in data:
+            format = bulk_format()
+            if format != 'application/json' and mode == 'float':
+                columns = data['columns']
+                values = _vector_columns(compiled, columns, _column_rows(compiled, columns))
+                return _bulk_response(format, [('results', values)])
+            results = evaluate_columns(compiled, data['columns'], mode, precision)
+            return _json_response({'success': True, 'results': results})
+        bindings = data.get('bindings', {})
+        if isinstance(bindings, list):
+            if len(bindings) > MAX_BATCH_SIZE:
+                return _json_response({'success': False, 'error': 'Too many bindings'})
+            results = [evaluate_bindings(compiled, item, mode, precision) for item in bindings]
+            return _json_response({'success': True, 'results': results})
+        return _json_response(evaluate_bindings(compiled, bindings, mode, precision))
+    except Exception as e:
+        return _json_response({'success': False, 'error': str(e)})
+
+# Tabulation
+#
+# POST /tabulate samples an expression in x over [start, stop] for plotting.
+# It starts from `points` evenly spaced samples and then refines adaptively:
+# each round evaluates the midpoints of the intervals still under
+# suspicion, in one vectorized call, and keeps splitting those where the
+# midpoint is further than `tolerance` (relative to the y range) from the
+# straight line between the ends, or where only one side is finite. Steep
+# and curved regions end up densely sampled, flat ones stay coarse. Trig
+# functions take radians unless "mode" is "degrees", as in /trig.
+#
+# The response is columnar: {"x": [...], "y": [...]} with null where the
+# expression is undefined, or x and y columns in one of the bulk formats.
+
+TABULATE_POINTS = 65
+TABULATE_MAX_POINTS = 2000
+MAX_TABULATE_POINTS = 100000
+TABULATE_TOLERANCE = 1e-3
+TABULATE_MAX_ROUNDS = 16
+
+def _degrees(node):
+    # Rewrite trig calls so that angles are in degrees
+    kind = node[0]
+    if kind == 'bin':
+        operand, links = _left_chain(node)
+        node = _degrees(operand)
+        for link in links:
+            node = (kind, link[1], node, _degrees(link[3]))
+        return node
+    if kind in ('neg', 'pos'):
+        return (kind, _degrees(node[1]))
+    if kind != 'call':
+        return node
+    arguments = tuple(_degrees(argument) for argument in node[2:])
+    angle = FUNCTIONS[node[1]].angle
+    if angle == 'in':
+        arguments = (('bin', '*', arguments[0], ('num', math.pi / 180, repr(math.pi / 180))),)
+    call = (kind, node[1]) + arguments
+    if angle == 'out':
+        return ('bin', '*', call, ('num', 180 / math.pi, repr(180 / math.pi)))
+    return call
+
+def _number_option(data, name, default=None):
+    value = data.get(name, default)
+    if type(value) not in (int, float) or not math.isfinite(value):
+        raise ExpressionError('Invalid %s' % name)
+    return value
+
+def tabulate(node, start, stop, points=TABULATE_POINTS, max_points=TABULATE_MAX_POINTS,
+             tolerance=TABULATE_TOLERANCE):
+    # Returns (x, y) float64 arrays, sorted by x
+    deadline = limits.deadline()
+    
+    def f(x):
+        with np.errstate(all='ignore'):
+            y = _evaluate_vector(node, {'x': x}, deadline)
+        return np.array(np.broadcast_to(y, x.shape), dtype=np.float64)
+    
+    xs = np.linspace(start, stop, points)
+    ys = f(xs)
+    # Intervals (xs[i], xs[i + 1]) whose midpoint still has to be checked
+    active = np.ones(points - 1, dtype=bool)
+    
+    for _ in range(TABULATE_MAX_ROUNDS):
+        budget = max_points - len(xs)
+        if budget <= 0 or not active.any():
+            break
+        _check_deadline(deadline)
+        
+        intervals = np.nonzero(active)[0]
+        left, right = ys[intervals], ys[intervals + 1]
+        mid_x = (xs[intervals] + xs[intervals + 1]) / 2
+        mid_y = f(mid_x)
+        finite = ys[np.isfinite(ys)]
+        scale = finite.max() - finite.min() if len(finite) else 0.0
+        error = np.abs(mid_y - (left + right) / 2)
+        split = (error > tolerance * (scale or 1.0)) | (np.isfinite(left) != np.isfinite(right))
+        
+        # Over budget, refine where the error is largest
+        chosen = np.nonzero(split)[0]
+        if len(chosen) > budget:
+            chosen = chosen[np.argsort(np.nan_to_num(error[chosen], nan=np.inf))[::-1][:budget]]
+            chosen.sort()
+        
+        # Positions of the new samples once inserted; both halves of each
+        # split interval are checked in the next round
+        positions = intervals[chosen] + 1 + np.arange(len(chosen))
+        xs = np.insert(xs, intervals[chosen] + 1, mid_x[chosen])
+        ys = np.insert(ys, intervals[chosen] + 1, mid_y[chosen])
+        active = np.zeros(len(xs) - 1, dtype=bool)
+        active[positions - 1] = True
+        active[positions] = True
+    
+    return xs, np.round(ys, 10)
+
+@app.route('/tabulate', methods=['POST'])
+def tabulate_endpoint():
+    try:
+        if load_numpy() is None:
+            raise ExpressionError('Tabulation requires NumPy')
+        data = request.json
+        expression = data.get('expression', '')
+        if not isinstance(expression, str):
+            raise ExpressionError('Invalid expression')
+        _, compiled = compile_expression(expression)
+        for name in compiled.variables:
+            if name != 'x':
+                raise ExpressionError('Unknown variable %s' % name)
+        node = compiled.node
+        if data.get('mode', 'radians') == 'degrees':
+            node = _degrees(node)
+        
+        start = _number_option(data, 'start')
+        stop = _number_option(data, 'stop')
+        if not start < stop:
+            raise ExpressionError('start must be less than stop')
+        tolerance = _number_option(data, 'tolerance', TABULATE_TOLERANCE)
+        points = data.get('points', TABULATE_POINTS)
+        max_points = data.get('max_points', max(TABULATE_MAX_POINTS, points) if type(points) is int else 0)
+        if type(points) is not int or type(max_points) is not int or not 2 <= points <= max_points <= MAX_TABULATE_POINTS:
+            raise ExpressionError('Invalid number of points')
+        if not tolerance > 0:
+            raise ExpressionError('Invalid tolerance')
+        
+        start_time = time.perf_counter()
+        xs, ys = tabulate(node, start, stop, points, max_points, tolerance)
+        _observe_stage('evaluate', start_time)
+    except Exception as e:
+        return _json_response({'success': False, 'error': str(e)})
+    
+    format = bulk_format()
+    if format != 'application/json':
+        return _bulk_response(format, [('x', xs), ('y', ys)])
+    y = [value if math.isfinite(value) else None for value in ys.tolist()]
+    return _json_response({'success': True, 'x': xs.tolist(), 'y': y})
+
+def trig(func, value, mode='degrees'):
+    # Any one-argument function; angles are converted in degrees mode
+    function = FUNCTIONS.get(func)
+    if function is None or function.arity != 1:
+        raise ExpressionError('Unknown function')
+    if function.angle == 'in' and mode == 'degrees':
+        value = math.radians(value)
+    result = function.scalar(value)
+    if function.angle == 'out' and mode == 'degrees':
+        result = math.degrees(result)
+    
+    # Round to avoid floating point errors
+    return round(result, 10)
+
+def trig_values(func, values, mode='degrees'):
+    # Vectorized trig over a sequence of values. Out-of-domain inputs produce
+    # NaN in the returned float64 array instead of failing the whole call.
+    if load_numpy() is None:
+        results = []
+        for value in values:
+            try:
+                results.append(trig(func, value, mode))
+            except ExpressionError as e:
+                if str(e) == 'Unknown function':
+                    raise
+                results.append(float('nan'))
+        return results
+    
+    function = FUNCTIONS.get(func)
+    if function is None or function.arity != 1:
+        raise ExpressionError('Unknown function')
+    values = np.asarray(values, dtype=np.float64)
+    
+    with np.errstate(all='ignore'):
+        if function.angle == 'in' and mode == 'degrees':
+            values = np.radians(values)
+        result = function.vector(values)
+        if function.angle == 'out' and mode == 'degrees':
+            result = np.degrees(result)
+    
+    # Round to avoid floating point errors
+    return np.round(result, 10)
+
+def _trig_request():
+    # Bulk binary bodies are little-endian float64 arrays, with the function
+    # and mode passed as query parameters
+    if request.mimetype == 'application/octet-stream':
+        if load_numpy() is None:
+            raise ExpressionError('Binary bodies require NumPy')
+        values = np.frombuffer(request.get_data(), dtype='<f8')
+        return request.args, values
+    data = request.json
+    return data, data.get('values')
+
+def _trig_payload(data, values, raw=False):
+    func = data.get('function', '')
+    mode = data.get('mode', 'degrees')
+    start = time.perf_counter()
+    try:
+        return _trig_results(func, mode, data, values, raw)
+    finally:
+        seconds = time.perf_counter() - start
+        label = func if func in FUNCTIONS else 'unknown'
+        metrics.observe('calculator_trig_duration_seconds', (label,), seconds)
+        profile = _profile.get()
+        if profile is not None:
+            profile.append(('trig', seconds))
+
+def _trig_results(func, mode, data, values, raw=False):
+    if values is not None:
+        results = trig_values(func, values, mode)
+        if raw:
+            # Left as an array for _bulk_response
+            return {'success': True, 'results': results}
+        if np is not None:
+            results = results.tolist()
+        # NaN and infinities are not valid JSON, report them as null
+        results = [result if math.isfinite(result) else None for result in results]
+        return {'success': True, 'results': results}
+    
+    value = data.get('value', 0)
+    return {'success': True, 'result': trig(func, value, mode)}
+
+@app.route('/trig', methods=['POST'])
+def trigonometric_function():
+    try:
+        data, values = _trig_request()
+        format = bulk_format() if values is not None else 'application/json'
+        if format != 'application/json':
+            return _bulk_response(format, [('results', _trig_payload(data, values, raw=True)['results'])])
+        return _json_response(_trig_payload(data, values))
+    except Exception as e:
+        return _json_response({'success': False, 'error': str(e)})
+
+# History
+#
+# Calculation history is kept per user in SQLite (WAL mode, one connection
+# per thread). The user is a namespace the client names, not an identity:
+# there is no authentication, so anyone who knows (or guesses) a user can
+# list and append to its history. Clients should pick an unguessable user,
+# nothing sensitive belongs in it, and there is no endpoint to delete it.
+# Listing is newest first with keyset pagination: each page
+# returns a `next` cursor to pass back as `before`, so deep pages cost the
+# same as the first one. Both access paths are served by an index:
+#   (user, created, id)     time ordered listing and since/until filters
+#   (user, expression)      prefix search, as a range scan on the index
+
+app.config.setdefault('HISTORY_DATABASE', os.environ.get(
+    'CALCULATOR_HISTORY_DB',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calculator_history.db')))
+
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+MAX_HISTORY_EXPRESSION = 4096
+MAX_HISTORY_APPEND = 1000
+
+_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    created REAL NOT NULL,
+    expression TEXT NOT NULL,
+    result TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_user_created ON history (user, created, id);
+CREATE INDEX IF NOT EXISTS history_user_expression ON history (user, expression);
+"""
+
+_history_local = threading.local()
+
+def history_db():
+    connection = getattr(_history_local, 'connection', None)
+    path = app.config['HISTORY_DATABASE']
+    if connection is None or _history_local.path != path:
+        import sqlite3
+        connection = sqlite3.connect(path, timeout=10, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(_HISTORY_SCHEMA)
+        _history_local.connection = connection
+        _history_local.path = path
+    return connection
+
+def _history_user(data):
+    user = data.get('user')
+    if user is None:
+        raise ExpressionError('Missing user')
+    if not isinstance(user, str) or not user or len(user) > 256:
+        raise ExpressionError('Invalid user')
+    return user
+
+def append_history(user, entries):
+    now = time.time()
+    rows = []
+    for entry in entries:
+        expression = entry.get('expression')
+        if not isinstance(expression, str) or len(expression) > MAX_HISTORY_EXPRESSION:
+            raise ExpressionError('Invalid expression')
+        created = entry.get('created', now)
+        # bool is an int, and NaN or out of range times cannot be stored as REAL
+        if type(created) not in (int, float):
+            raise ExpressionError('Invalid created time')
+        try:
+            created = float(created)
+        except OverflowError:
+            raise ExpressionError('Invalid created time')
+        if not math.isfinite(created):
+            raise ExpressionError('Invalid created time')
+        # Results are stored as JSON so numbers and exact-mode strings round-trip
+        rows.append((user, created, expression, json.dumps(entry.get('result'))))
+    connection = history_db()
+    with connection:
+        connection.execute('BEGIN')
+        cursor = connection.executemany(
+            'INSERT INTO history (user, created, expression, result) VALUES (?, ?, ?, ?)', rows)
+    return cursor.rowcount
+
+def _prefix_upper_bound(prefix):
+    # Smallest string greater than every string starting with prefix
+    return prefix + '\U0010ffff'
+
+def list_history(user, limit=HISTORY_PAGE_SIZE, before=None, prefix=None, since=None, until=None):
+    where = ['user = ?']
+    params = [user]
+    if prefix:
+        where.append('expression >= ? AND expression < ?')
+        params += [prefix, _prefix_upper_bound(prefix)]
+    if since is not None:
+        where.append('created >= ?')
+        params.append(since)
+    if until is not None:
+        where.append('created < ?')
+        params.append(until)
+    if before:
+        created, _, row_id = before.partition(':')
+        try:
+            params += [float(created), int(row_id)]
+        except ValueError:
+            raise ExpressionError('Invalid cursor')
+        where.append('(created, id) < (?, ?)')
+    
+    rows = history_db().execute(
+        'SELECT id, created, expression, result FROM history WHERE %s '
+        'ORDER BY created DESC, id DESC LIMIT ?' % ' AND '.join(where),
+        params + [limit + 1]).fetchall()
+    
+    items = [{'id': row_id, 'created': created, 'expression': expression, 'result': json.loads(result)}
+             for row_id, created, expression, result in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = '%r:%d' % (items[-1]['created'], items[-1]['id'])
+    return items, next_cursor
+
+@app.route('/history', methods=['GET'])
+def history_list():
+    try:
+        args = request.args
+        limit = args.get('limit', HISTORY_PAGE_SIZE, type=int)
+        if not 0 < limit <= MAX_HISTORY_PAGE_SIZE:
+            return _json_response({'success': False, 'error': 'Invalid limit'})
+        items, next_cursor = list_history(
+            _history_user(args), limit,
+            before=args.get('before'),
+            prefix=args.get('prefix'),
+            since=args.get('since', type=float),
+            until=args.get('until', type=float))
+        return _json_response({'success': True, 'items': items, 'next': next_cursor})
+    except Exception as e:
+        return _json_response({'success': False, 'error': str(e)})
+
+@app.route('/history', methods=['POST'])
+def history_append():
+    try:
+        data = request.json
+        # Either one entry or {"entries": [...]}
+        entries = data.get('entries')
+        if entries is None:
+            entries = [data]
+        if not isinstance(entries, list) or len(entries) > MAX_HISTORY_APPEND:
+            return _json_response({'success': False, 'error': 'Invalid entries'})
+        count = append_history(_history_user(data), entries)
+        return _json_response({'success': True, 'appended': count})
+    except Exception as e:
+        return _json_response({'success': False, 'error': str(e)})
+
+# Asynchronous (ASGI) app
+#
+# asgi_app serves POST /calculate and POST /trig with the same JSON contracts
+# as the Flask views, from a single event loop with no thread per request.
+# Expressions over OFFLOAD_COST go to the shared process pool so they never
+# stall the loop; everything else is answered inline. Run it with `python -m calculator serve-async` or any ASGI
+# server, e.g. `uvicorn calculator:asgi_app`.
+
+_async_slots = None
+
+async def _calculate_async(body, content_type, query):
+    global _async_slots
+    data = json_loads(body)
+    expression = data.get('expression', '')
+    mode, precision = _mode_options(data)
+    key, node, payload = prepare(expression, mode, precision)
+    if payload is not None:
+        return payload
+    
+    start = time.perf_counter()
+    if estimate_cost(node, mode, precision) <= OFFLOAD_COST:
+        outcome = settle(node, mode, precision)
+        tier_stats['inline'].record(_observe_stage('evaluate', start) - start)
+        return store(key, node, outcome)
+    
+    import asyncio
+    if _async_slots is None:
+        _async_slots = asyncio.Semaphore(OFFLOAD_MAX_PENDING)
+    pool = warm_offload_pool()
+    from concurrent.futures.process import BrokenProcessPool
+    _track_pending(1)
+    try:
+        async with _async_slots:
+            loop = asyncio.get_running_loop()
+            outcome = await loop.run_in_executor(pool, settle_flat, flatten(node), mode, precision)
+    except BrokenProcessPool:
+        outcome = _pool_failed(pool)
+    finally:
+        _track_pending(-1)
+    tier_stats['offload'].record(_observe_stage('evaluate', start) - start)
+    return store(key, node, outcome)
+
+async def _trig_async(body, content_type, query):
+    if content_type == 'application/octet-stream':
+        if load_numpy() is None:
+            raise ExpressionError('Binary bodies require NumPy')
+        data = {key: values[0] for key, values in urllib.parse.parse_qs(query).items()}
+        return _trig_payload(data, np.frombuffer(body, dtype='<f8'))
+    data = json_loads(body)
+    return _trig_payload(data, data.get('values'))
+
+_ASYNC_ROUTES = {
+    '/calculate': _calculate_async,
+    '/trig': _trig_async,
+}
+
+async def _send_response(send, status, body, content_type):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def _asgi_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            shutdown_offload_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def asgi_app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _asgi_lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    
+    route = _ASYNC_ROUTES.get(scope['path'])
+    if route is None:
+        return await _send_response(send, 404, b'Not Found', b'text/plain')
+    if scope['method'] != 'POST':
+        return await _send_response(send, 405, b'Method Not Allowed', b'text/plain')
+    
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    
+    content_type = ''
+    for name, value in scope['headers']:
+        if name == b'content-type':
+            content_type = value.decode('latin-1').split(';')[0].strip().lower()
+    
+    start = time.perf_counter()
+    try:
+        payload = await route(b''.join(chunks), content_type, scope.get('query_string', b'').decode('latin-1'))
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+        payload = {'success': False, 'error': str(e)}
+    serialize_start = time.perf_counter()
+    payload, body = encode_payload(payload)
+    _observe_stage('serialize', serialize_start)
+    await _send_response(send, 200, body, b'application/json')
+    
+    route = scope['path']
+    metrics.inc('calculator_requests_total', (route,))
+    if not payload['success']:
+        metrics.inc('calculator_errors_total', (route, metrics.error_label(payload['error'])))
+    metrics.observe('calculator_request_duration_seconds', (route,), time.perf_counter() - start)
+
+# Command line
+#
+#   python calculator.py                        development server (debug, reloader)
+#   python -m calculator serve [options]        production server
+#   python -m calculator serve-async [options]  ASGI server for asgi_app
+#
+# serve runs the app under gunicorn with a pre-forked pool of threaded
+# workers. The app is imported once in the master and shared copy-on-write.
+# With --no-preload each worker imports calculator:app itself instead. SIGHUP
+# to the master restarts the workers gracefully: in-flight requests finish
+# before the old workers exit. Only --no-preload workers pick up code changes
+# that way; with preloading on they need a full restart.
+#
+# Throughput for POST /calculate {"expression": "2+3*4"} on a single vCPU
+# (shared with the load generator), 16 concurrent keep-alive clients,
+# 10 second runs:
+#
+#   app.run(debug=True)                        ~860 req/s
+#   serve --workers 1 --threads 4              ~1,550 req/s
+#   serve --workers 3 --threads 4              ~1,380 req/s
+#
+# Extra workers only pay off with extra cores; on one core the gain comes
+# from dropping the debugger/reloader and keeping connections alive.
+
+def _run_production_server(options):
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit('serve requires gunicorn: pip install gunicorn')
+    
+    class CalculatorServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            if options['preload_app']:
+                return app
+            # Run as a script the master's copy is __main__, so this is a
+            # fresh import in the worker
+            from gunicorn.util import import_app
+            return import_app('calculator:app')
+    
+    CalculatorServer().run()
+
+def _warm_worker_pool(worker):
+    # Start each worker's offload pool before it takes traffic. Without
+    # preloading the worker serves the calculator module that load()
+    # imported, which isn't this one when run as a script.
+    if worker.cfg.preload_app:
+        warm_offload_pool()
+    else:
+        sys.modules['calculator'].warm_offload_pool()
+
+def _set_api_only():
+    app.config['API_ONLY'] = True
+    # Worker processes that import the app by name read it from the environment
+    os.environ['CALCULATOR_API_ONLY'] = '1'
+
+def _set_offload_pool_size(size, workers):
+    global OFFLOAD_POOL_SIZE
+    # Each worker process warms its own pool, so by default the CPUs are
+    # split between workers rather than every worker getting one process
+    # per CPU ((2C+1) * C processes under serve's default --workers)
+    if size is None:
+        if os.environ.get('CALCULATOR_OFFLOAD_POOL_SIZE'):
+            size = OFFLOAD_POOL_SIZE
+        else:
+            size = max(1, (os.cpu_count() or 1) // workers)
+    OFFLOAD_POOL_SIZE = size
+    # Worker processes that import the app by name read it from the environment
+    os.environ['CALCULATOR_OFFLOAD_POOL_SIZE'] = str(size)
+
+def _run_async_server(args):
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('serve-async requires uvicorn: pip install uvicorn')
+    
+    host, _, port = args.bind.rpartition(':')
+    _set_offload_pool_size(args.pool_size, args.workers)
+    uvicorn.run('calculator:asgi_app' if args.workers > 1 else asgi_app,
+                host=host or '127.0.0.1', port=int(port), workers=args.workers,
+                timeout_keep_alive=args.keepalive, backlog=args.backlog,
+                log_level='info')
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='calculator')
+    commands = parser.add_subparsers(dest='command')
+    
+    dev = commands.add_parser('dev', help='run the development server')
+    dev.add_argument('--host', default='127.0.0.1')
+    dev.add_argument('--port', type=int, default=5000)
+    
+    serve = commands.add_parser('serve', help='run the production server')
+    serve.add_argument('--bind', action='append',
+                       help='address to listen on, e.g. 0.0.0.0:8000 or unix:/run/calc.sock (repeatable)')
+    serve.add_argument('--workers', type=int, default=(os.cpu_count() or 1) * 2 + 1,
+                       help='worker processes (default: 2 * CPUs + 1)')
+    serve.add_argument('--threads', type=int, default=4, help='threads per worker')
+    serve.add_argument('--keepalive', type=int, default=5,
+                       help='seconds to hold idle keep-alive connections')
+    serve.add_argument('--backlog', type=int, default=2048)
+    serve.add_argument('--timeout', type=int, default=30,
+                       help='seconds before a silent worker is killed and restarted')
+    serve.add_argument('--graceful-timeout', type=int, default=30,
+                       help='seconds workers get to finish requests on reload/shutdown')
+    serve.add_argument('--max-requests', type=int, default=0,
+                       help='recycle a worker after this many requests (0 disables)')
+    serve.add_argument('--pool-size', type=int,
+                       help='processes per worker for expensive expressions (default: CPUs / workers, at least 1)')
+    serve.add_argument('--api-only', action='store_true',
+                       help='serve the API without the calculator page')
+    serve.add_argument('--no-preload', dest='preload', action='store_false',
+                       help='import the app in each worker instead of once in the master')
+    
+    serve_async = commands.add_parser('serve-async', help='run the ASGI app under uvicorn')
+    serve_async.add_argument('--bind', default='127.0.0.1:8000', help='host:port to listen on')
+    serve_async.add_argument('--workers', type=int, default=1,
+                             help='event loop processes (default: 1)')
+    serve_async.add_argument('--pool-size', type=int,
+                             help='processes per worker for expensive expressions (default: CPUs / workers, at least 1)')
+    serve_async.add_argument('--keepalive', type=int, default=5,
+                             help='seconds to hold idle keep-alive connections')
+    serve_async.add_argument('--backlog', type=int, default=2048)
+    
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        _set_offload_pool_size(args.pool_size, args.workers)
+        if args.api_only:
+            _set_api_only()
+        _run_production_server({
+            'bind': args.bind or ['127.0.0.1:8000'],
+            'workers': args.workers,
+            'threads': args.threads,
+            'worker_class': 'gthread',
+            'keepalive': args.keepalive,
+            'backlog': args.backlog,
+            'timeout': args.timeout,
+            'graceful_timeout': args.graceful_timeout,
+            'max_requests': args.max_requests,
+            'max_requests_jitter': args.max_requests // 10,
+            'preload_app': args.preload,
+            'post_worker_init': _warm_worker_pool,
+        })
+    elif args.command == 'serve-async':
+        _run_async_server(args)
+    elif args.command == 'dev':
+        app.run(host=args.host, port=args.port, debug=True)
+    else:
+        app.run(debug=True)
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    main()
@@ -0,0 +1,641 @@
+let display = document.getElementById('display');
+let expressionDisplay = document.getElementById('expression');
+let currentInput = '0';
+let operator = null;
+let previousValue = null;
+let shouldResetDisplay = false;
+let operatorSymbol = null;
+let memory = 0;
+let angleMode = 'degrees'; // 'degrees' or 'radians'
+let darkMode = false;
+
+window.addEventListener('load', function() {
+    loadHistory();
+    const savedMemory = localStorage.getItem('calcMemory');
+    if (savedMemory) {
+        memory = parseFloat(savedMemory);
+        updateMemoryIndicator();
+    }
+});
+
+function toggleDarkMode() {
+    darkMode = !darkMode;
+    document.body.classList.toggle('dark-mode');
+    localStorage.setItem('darkMode', darkMode);
+}
+
+function toggleAngleMode() {
+    angleMode = angleMode === 'degrees' ? 'radians' : 'degrees';
+    document.getElementById('angleMode').textContent = angleMode === 'degrees' ? 'DEG' : 'RAD';
+    document.getElementById('angleIndicator').textContent = angleMode === 'degrees' ? 'Degrees' : 'Radians';
+}
+
+function updateMemoryIndicator() {
+    const indicator = document.getElementById('memoryIndicator');
+    const value = document.getElementById('memoryValue');
+    if (memory !== 0) {
+        indicator.style.display = 'inline-block';
+        value.textContent = memory.toFixed(4);
+    } else {
+        indicator.style.display = 'none';
+    }
+    localStorage.setItem('calcMemory', memory);
+}
+
+// History
+//
+// Entries live in IndexedDB and are only ever appended (or cleared), so an
+// "=" press writes one record instead of re-serializing the whole list. The
+// panel is virtualized: only rows in or near the viewport exist in the DOM.
+// Rows are positioned from the bottom by their append index, so adding an
+// entry inserts one node and leaves every existing row where it is.
+const HISTORY_DB = 'calculator';
+const HISTORY_STORE = 'history';
+const HISTORY_LIMIT = 5000;
+const HISTORY_ROW_HEIGHT = 46; // .history-list .history-item height + gap
+const HISTORY_OVERSCAN = 5;
+
+let historyEntries = []; // oldest first
+let historyRows = new Map(); // entry index -> row element
+let historyDb = null;
+let historyRenderQueued = false;
+
+function openHistoryDb() {
+    return new Promise((resolve, reject) => {
+        if (!window.indexedDB) {
+            reject(new Error('IndexedDB unavailable'));
+            return;
+        }
+        const request = indexedDB.open(HISTORY_DB, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(HISTORY_STORE, {autoIncrement: true});
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function historyTransaction(mode, work) {
+    return new Promise((resolve, reject) => {
+        const transaction = historyDb.transaction(HISTORY_STORE, mode);
+        const result = work(transaction.objectStore(HISTORY_STORE));
+        transaction.oncomplete = () => resolve(result && result.result);
+        transaction.onerror = () => reject(transaction.error);
+    });
+}
+
+async function loadHistory() {
+    setupHistoryList();
+    try {
+        historyDb = await openHistoryDb();
+        // One-time import of the old localStorage history (newest first)
+        const legacy = localStorage.getItem('calcHistory');
+        if (legacy) {
+            const items = JSON.parse(legacy).reverse();
+            await historyTransaction('readwrite', store => {
+                for (const item of items) {
+                    const separator = item.lastIndexOf(' = ');
+                    store.add({expression: item.slice(0, separator), result: item.slice(separator + 3)});
+                }
+            });
+            localStorage.removeItem('calcHistory');
+        }
+        const keys = await historyTransaction('readonly', store => store.getAllKeys());
+        if (keys.length > HISTORY_LIMIT) {
+            const oldest = keys[keys.length - HISTORY_LIMIT - 1];
+            await historyTransaction('readwrite', store => store.delete(IDBKeyRange.upperBound(oldest)));
+        }
+        historyEntries = await historyTransaction('readonly', store => store.getAll());
+    } catch (e) {
+        // Without IndexedDB history still works, it just isn't saved
+        historyDb = null;
+    }
+    resetHistoryRows();
+}
+
+function setupHistoryList() {
+    const list = document.getElementById('historyList');
+    list.addEventListener('scroll', scheduleHistoryRender);
+    list.addEventListener('click', event => {
+        const row = event.target.closest('.history-item');
+        if (row) {
+            useHistoryItem(historyEntries[Number(row.dataset.index)]);
+        }
+    });
+}
+
+function addToHistory(expression, result) {
+    const entry = {expression: expression, result: String(result), created: Date.now()};
+    historyEntries.push(entry);
+    if (historyDb) {
+        historyTransaction('readwrite', store => store.add(entry)).catch(() => {});
+    }
+    const list = document.getElementById('historyList');
+    // Keep the rows the user is looking at in place when scrolled down
+    if (list.scrollTop > 0) {
+        list.scrollTop += HISTORY_ROW_HEIGHT;
+    }
+    updateHistoryDisplay();
+}
+
+function scheduleHistoryRender() {
+    if (!historyRenderQueued) {
+        historyRenderQueued = true;
+        requestAnimationFrame(() => {
+            historyRenderQueued = false;
+            updateHistoryDisplay();
+        });
+    }
+}
+
+function resetHistoryRows() {
+    for (const row of historyRows.values()) {
+        row.remove();
+    }
+    historyRows.clear();
+    updateHistoryDisplay();
+}
+
+function updateHistoryDisplay() {
+    const list = document.getElementById('historyList');
+    const spacer = document.getElementById('historySpacer');
+    const empty = document.getElementById('historyEmpty');
+    const count = historyEntries.length;
+    empty.style.display = count === 0 ? 'block' : 'none';
+    spacer.style.height = (count * HISTORY_ROW_HEIGHT) + 'px';
+
+    // Display position 0 is the newest entry, at the top
+    const first = Math.max(0, Math.floor(list.scrollTop / HISTORY_ROW_HEIGHT) - HISTORY_OVERSCAN);
+    const last = Math.min(count - 1,
+        Math.ceil((list.scrollTop + list.clientHeight) / HISTORY_ROW_HEIGHT) + HISTORY_OVERSCAN);
+    const newest = count - 1 - first;
+    const oldest = count - 1 - last;
+
+    for (const [index, row] of historyRows) {
+        if (index < oldest || index > newest) {
+            row.remove();
+            historyRows.delete(index);
+        }
+    }
+    for (let index = oldest; index <= newest; index++) {
+        if (!historyRows.has(index)) {
+            const entry = historyEntries[index];
+            const row = document.createElement('div');
+            row.className = 'history-item';
+            row.dataset.index = index;
+            row.style.bottom = (index * HISTORY_ROW_HEIGHT) + 'px';
+            row.textContent = entry.expression + ' = ' + entry.result;
+            spacer.appendChild(row);
+            historyRows.set(index, row);
+        }
+    }
+}
+
+function useHistoryItem(entry) {
+    if (entry) {
+        currentInput = entry.result;
+        updateDisplay();
+    }
+}
+
+function clearHistory() {
+    if (confirm('Clear all history?')) {
+        historyEntries = [];
+        if (historyDb) {
+            historyTransaction('readwrite', store => store.clear()).catch(() => {});
+        }
+        resetHistoryRows();
+    }
+}
+
+function memoryClear() {
+    memory = 0;
+    updateMemoryIndicator();
+}
+
+function memoryRecall() {
+    currentInput = String(memory);
+    shouldResetDisplay = true;
+    updateDisplay();
+}
+
+function memoryAdd() {
+    let num = parseFloat(currentInput);
+    if (!isNaN(num)) {
+        memory += num;
+        updateMemoryIndicator();
+        shouldResetDisplay = true;
+    }
+}
+
+function memorySubtract() {
+    let num = parseFloat(currentInput);
+    if (!isNaN(num)) {
+        memory -= num;
+        updateMemoryIndicator();
+        shouldResetDisplay = true;
+    }
+}
+
+// Keyboard support
+document.addEventListener('keydown', function(event) {
+    const key = event.key;
+
+    if (key >= '0' && key <= '9') {
+        appendNumber(key);
+        event.preventDefault();
+    }
+    else if (key === '.') {
+        appendNumber('.');
+        event.preventDefault();
+    }
+    else if (key === '+') {
+        appendOperator('+');
+        event.preventDefault();
+    }
+    else if (key === '-') {
+        appendOperator('-');
+        event.preventDefault();
+    }
+    else if (key === '*') {
+        appendOperator('*');
+        event.preventDefault();
+    }
+    else if (key === '/') {
+        appendOperator('/');
+        event.preventDefault();
+    }
+    else if (key === 'Enter') {
+        calculate();
+        event.preventDefault();
+    }
+    else if (key === 'Escape') {
+        clearDisplay();
+        event.preventDefault();
+    }
+    else if (key === 'Backspace') {
+        deleteLast();
+        event.preventDefault();
+    }
+    else if (key === '(') {
+        appendNumber('(');
+        event.preventDefault();
+    }
+    else if (key === ')') {
+        appendNumber(')');
+        event.preventDefault();
+    }
+});
+
+function updateDisplay() {
+    display.textContent = currentInput;
+    updateExpressionDisplay();
+}
+
+function updateExpressionDisplay() {
+    if (previousValue === null) {
+        expressionDisplay.textContent = '';
+    } else {
+        let expr = previousValue;
+        if (operatorSymbol) {
+            expr += ' ' + operatorSymbol + ' ';
+            if (!shouldResetDisplay) {
+                expr += currentInput;
+            }
+        }
+        expressionDisplay.textContent = expr;
+    }
+}
+
+function appendNumber(num) {
+    if (shouldResetDisplay) {
+        currentInput = num;
+        shouldResetDisplay = false;
+    } else {
+        if (currentInput === '0' && num !== '.' && num !== '(' && num !== ')') {
+            currentInput = num;
+        } else if (num === '.' && currentInput.includes('.')) {
+            return;
+        } else {
+            currentInput += num;
+        }
+    }
+    updateDisplay();
+}
+
+function appendOperator(op) {
+    let opSymbol = op === '/' ? '÷' : op === '*' ? '×' : op;
+
+    if (previousValue === null) {
+        previousValue = currentInput;
+    } else if (!shouldResetDisplay) {
+        calculate();
+        previousValue = display.textContent;
+    }
+    operator = op;
+    operatorSymbol = opSymbol;
+    shouldResetDisplay = true;
+    updateExpressionDisplay();
+}
+
+function deleteLast() {
+    if (!shouldResetDisplay && currentInput !== '0') {
+        currentInput = currentInput.slice(0, -1);
+        if (currentInput === '') {
+            currentInput = '0';
+        }
+        updateDisplay();
+    }
+}
+
+function percentage() {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num)) {
+            currentInput = String(num / 100);
+            updateDisplay();
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+function modulo() {
+    if (previousValue === null) {
+        previousValue = currentInput;
+    } else if (!shouldResetDisplay) {
+        calculate();
+        previousValue = display.textContent;
+    }
+    operator = '%';
+    operatorSymbol = 'mod';
+    shouldResetDisplay = true;
+    updateExpressionDisplay();
+}
+
+function absolute() {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num)) {
+            currentInput = String(Math.abs(num));
+            updateDisplay();
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+function cubeRoot() {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num)) {
+            currentInput = String(Math.cbrt(num));
+            shouldResetDisplay = true;
+            updateDisplay();
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+function naturalLog() {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num) && num > 0) {
+            currentInput = String(Math.log(num));
+            shouldResetDisplay = true;
+            updateDisplay();
+        } else {
+            currentInput = 'Error';
+            updateDisplay();
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+function customPower() {
+    if (previousValue === null) {
+        previousValue = currentInput;
+    } else if (!shouldResetDisplay) {
+        calculate();
+        previousValue = display.textContent;
+    }
+    operator = '**';
+    operatorSymbol = '^';
+    shouldResetDisplay = true;
+    updateExpressionDisplay();
+}
+
+function trigFunction(func) {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num)) {
+            // Same computation and rounding as the server's /trig
+            const data = CalcEngine.trig(func, num, angleMode);
+            if (data.success) {
+                currentInput = String(data.result);
+                shouldResetDisplay = true;
+                updateDisplay();
+            } else {
+                currentInput = 'Error';
+                updateDisplay();
+            }
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+function squareRoot() {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num) && num >= 0) {
+            currentInput = String(Math.sqrt(num));
+            shouldResetDisplay = true;
+            updateDisplay();
+        } else {
+            currentInput = 'Error';
+            updateDisplay();
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+function power() {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num)) {
+            currentInput = String(num * num);
+            shouldResetDisplay = true;
+            updateDisplay();
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+function reciprocal() {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num) && num !== 0) {
+            currentInput = String(1 / num);
+            shouldResetDisplay = true;
+            updateDisplay();
+        } else {
+            currentInput = 'Error';
+            updateDisplay();
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+function exponential() {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num)) {
+            currentInput = String(Math.exp(num));
+            shouldResetDisplay = true;
+            updateDisplay();
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+// 0! to 18!, the factorials that are exact as JS numbers
+const FACTORIALS = [1];
+for (let n = 1; Number.isSafeInteger(FACTORIALS[n - 1] * n); n++) {
+    FACTORIALS.push(FACTORIALS[n - 1] * n);
+}
+
+function factorial() {
+    let num = parseFloat(currentInput);
+    if (isNaN(num)) {
+        return;
+    }
+    if (num >= 0 && num < FACTORIALS.length && Number.isInteger(num)) {
+        currentInput = String(FACTORIALS[num]);
+        shouldResetDisplay = true;
+        updateDisplay();
+        return;
+    }
+    // Exact big factorials (fraction mode returns them as strings, so no
+    // precision is lost in JSON) and gamma for non-integers come from the server
+    fetch('/calculate', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            expression: 'factorial(' + currentInput + ')',
+            mode: Number.isInteger(num) ? 'fraction' : 'float'
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        currentInput = data.success ? String(data.result) : 'Error';
+        shouldResetDisplay = true;
+        updateDisplay();
+    })
+    .catch(error => {
+        currentInput = 'Error';
+        updateDisplay();
+    });
+}
+
+function logarithm() {
+    try {
+        let num = parseFloat(currentInput);
+        if (!isNaN(num) && num > 0) {
+            currentInput = String(Math.log10(num));
+            shouldResetDisplay = true;
+            updateDisplay();
+        } else {
+            currentInput = 'Error';
+            updateDisplay();
+        }
+    } catch (e) {
+        currentInput = 'Error';
+        updateDisplay();
+    }
+}
+
+function appendConstant(constant) {
+    if (constant === 'π') {
+        currentInput = String(Math.PI);
+        shouldResetDisplay = true;
+        updateDisplay();
+    } else if (constant === 'e') {
+        currentInput = String(Math.E);
+        shouldResetDisplay = true;
+        updateDisplay();
+    }
+}
+
+function clearDisplay() {
+    currentInput = '0';
+    operator = null;
+    operatorSymbol = null;
+    previousValue = null;
+    shouldResetDisplay = false;
+    updateDisplay();
+}
+
+function toggleSign() {
+    if (currentInput !== '0') {
+        currentInput = currentInput.startsWith('-') ? currentInput.slice(1) : '-' + currentInput;
+        updateDisplay();
+    }
+}
+
+function showCalculation(data) {
+    if (data.success) {
+        currentInput = String(data.result);
+        addToHistory(expressionDisplay.textContent, data.result);
+    } else {
+        currentInput = 'Error';
+    }
+    operator = null;
+    operatorSymbol = null;
+    previousValue = null;
+    shouldResetDisplay = true;
+    updateDisplay();
+}
+
+function calculate() {
+    if (operator === null || previousValue === null) {
+        return;
+    }
+
+    let expression = previousValue + operator + currentInput;
+
+    // Evaluate locally; only results that need exact big integers go to the server
+    const local = CalcEngine.calculate(expression);
+    if (local !== null) {
+        showCalculation(local);
+        return;
+    }
+
+    fetch('/calculate', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({expression: expression})
+    })
+    .then(response => response.json())
+    .then(showCalculation)
+    .catch(error => showCalculation({success: false}));
+}
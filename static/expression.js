@@ -0,0 +1,227 @@
+// Client-side port of the expression engine in calculator.py.
+//
+// Same grammar, precedence and error messages as the server, so the page can
+// evaluate expressions without a round-trip. calculate() returns null when a
+// value can't be represented exactly as a JS number (large integers,
+// overflow) or the expression calls a function; callers should then ask the
+// server instead.
+const CalcEngine = (function() {
+    const TOKEN_RE = /\s*(?:([0-9]+\.?[0-9]*|\.[0-9]+)|(\*\*|\/\/|[-+*\/%^()×÷])|([A-Za-z_]\w*))/y;
+    const OPERATORS = {'^': '**', '×': '*', '÷': '/'};
+
+    class ExpressionError extends Error {}
+
+    // Raised when the expression is valid but needs the server's arithmetic
+    class NeedsServer extends Error {}
+
+    function tokenize(expression) {
+        const tokens = [];
+        const end = expression.trimEnd().length;
+        let pos = 0;
+        while (pos < end) {
+            TOKEN_RE.lastIndex = pos;
+            const match = TOKEN_RE.exec(expression);
+            if (match === null) {
+                throw new ExpressionError('Invalid expression');
+            }
+            if (match[3] !== undefined) {
+                // Functions (sqrt, ln, ...) are only implemented server-side
+                throw new NeedsServer();
+            }
+            if (match[1] !== undefined) {
+                const token = {kind: 'num', value: parseFloat(match[1]), float: match[1].includes('.')};
+                tokens.push(checkExact(token));
+            } else {
+                tokens.push({kind: 'op', value: OPERATORS[match[2]] || match[2]});
+            }
+            pos = TOKEN_RE.lastIndex;
+        }
+        return tokens;
+    }
+
+    function parse(expression) {
+        const tokens = tokenize(expression);
+        let pos = 0;
+
+        const isOp = (...ops) => pos < tokens.length && tokens[pos].kind === 'op' && ops.includes(tokens[pos].value);
+
+        function take(value) {
+            const token = tokens[pos];
+            if (token === undefined || (value !== undefined && (token.kind !== 'op' || token.value !== value))) {
+                throw new ExpressionError('Invalid expression');
+            }
+            pos++;
+            return token;
+        }
+
+        // expr := term (('+' | '-') term)*
+        function expr() {
+            let node = term();
+            while (isOp('+', '-')) {
+                node = {kind: 'bin', op: take().value, left: node, right: term()};
+            }
+            return node;
+        }
+
+        // term := factor (('*' | '/' | '//' | '%') factor)*
+        function term() {
+            let node = factor();
+            while (isOp('*', '/', '//', '%')) {
+                node = {kind: 'bin', op: take().value, left: node, right: factor()};
+            }
+            return node;
+        }
+
+        // factor := ('+' | '-') factor | power
+        function factor() {
+            if (isOp('-')) {
+                take();
+                return {kind: 'neg', operand: factor()};
+            }
+            if (isOp('+')) {
+                take();
+                return {kind: 'pos', operand: factor()};
+            }
+            return power();
+        }
+
+        // power := atom ['**' factor]   (right associative)
+        function power() {
+            const node = atom();
+            if (isOp('**')) {
+                take();
+                return {kind: 'bin', op: '**', left: node, right: factor()};
+            }
+            return node;
+        }
+
+        // atom := NUMBER | '(' expr ')'
+        function atom() {
+            const token = take();
+            if (token.kind === 'num') {
+                return token;
+            }
+            if (token.value === '(') {
+                const node = expr();
+                take(')');
+                return node;
+            }
+            throw new ExpressionError('Invalid expression');
+        }
+
+        const node = expr();
+        if (pos !== tokens.length) {
+            throw new ExpressionError('Invalid expression');
+        }
+        return node;
+    }
+
+    // Values carry a flag for whether Python would hold them as a float, so
+    // that division by zero errors and result rounding match the server.
+    // Python ints are exact at any size, JS numbers only up to 2^53, so any
+    // integer literal or intermediate past that goes to the server.
+    function checkExact(value) {
+        if (!value.float && !Number.isSafeInteger(value.value)) throw new NeedsServer();
+        return value;
+    }
+
+    function binary(op, a, b) {
+        const float = a.float || b.float;
+        switch (op) {
+            case '+': return {value: a.value + b.value, float: float};
+            case '-': return {value: a.value - b.value, float: float};
+            case '*': return {value: a.value * b.value, float: float};
+            case '/':
+                if (b.value === 0) throw new ExpressionError(float ? 'float division by zero' : 'division by zero');
+                return {value: a.value / b.value, float: true};
+            case '//':
+                if (b.value === 0) throw new ExpressionError(float ? 'float floor division by zero' : 'integer division or modulo by zero');
+                return {value: Math.floor(a.value / b.value), float: float};
+            case '%': {
+                if (b.value === 0) throw new ExpressionError(float ? 'float modulo' : 'integer modulo by zero');
+                // Python's modulo takes the sign of the divisor
+                let r = a.value % b.value;
+                if (r !== 0 && (r < 0) !== (b.value < 0)) r += b.value;
+                return {value: r, float: float};
+            }
+            case '**': {
+                if (a.value === 0 && b.value < 0) {
+                    throw new ExpressionError('0.0 cannot be raised to a negative power');
+                }
+                const value = Math.pow(a.value, b.value);
+                if (Number.isNaN(value)) throw new ExpressionError('Complex result');
+                return {value: value, float: float || b.value < 0};
+            }
+        }
+    }
+
+    function evaluateNode(node) {
+        switch (node.kind) {
+            case 'num': return {value: node.value, float: node.float};
+            case 'bin': return checkExact(binary(node.op, evaluateNode(node.left), evaluateNode(node.right)));
+            case 'neg': {
+                const operand = evaluateNode(node.operand);
+                return {value: -operand.value, float: operand.float};
+            }
+            default: return evaluateNode(node.operand);
+        }
+    }
+
+    // Equivalent of Python's round(x, 10) for display purposes. Both round
+    // the exact binary value, but toFixed() breaks ties away from zero and
+    // Python to even. A double is an exact tie at 10 decimals only when it
+    // is an odd multiple of 2^-11 (e.g. 1/2048); then an odd last digit is
+    // the away-from-zero choice and the even one is one below it.
+    function round10(x) {
+        if (!Number.isFinite(x) || Math.abs(x) >= 1e21) return x;
+        let text = Math.abs(x).toFixed(10);
+        const scaled = x * 2048;
+        if (Number.isInteger(scaled) && scaled % 2 !== 0) {
+            const last = text.charCodeAt(text.length - 1) - 48;
+            if (last % 2 === 1) text = text.slice(0, -1) + (last - 1);
+        }
+        return Math.sign(x) * parseFloat(text);
+    }
+
+    function evaluate(node) {
+        const result = evaluateNode(node);
+        if (!Number.isFinite(result.value)) throw new NeedsServer();
+        if (!result.float) return result.value;
+        return round10(result.value);
+    }
+
+    function calculate(expression) {
+        try {
+            return {success: true, result: evaluate(parse(expression))};
+        } catch (e) {
+            if (e instanceof ExpressionError) return {success: false, error: e.message};
+            if (e instanceof NeedsServer || e instanceof RangeError) return null;
+            throw e;
+        }
+    }
+
+    // Mirrors trig() in calculator.py
+    function trig(func, value, mode) {
+        const radValue = mode === 'degrees' ? value * (Math.PI / 180) : value;
+        const toMode = x => mode === 'degrees' ? x * (180 / Math.PI) : x;
+        let result;
+        switch (func) {
+            case 'sin': result = Math.sin(radValue); break;
+            case 'cos': result = Math.cos(radValue); break;
+            case 'tan': result = Math.tan(radValue); break;
+            case 'asin':
+                if (!(value >= -1 && value <= 1)) return {success: false, error: 'asin domain error'};
+                result = toMode(Math.asin(value));
+                break;
+            case 'acos':
+                if (!(value >= -1 && value <= 1)) return {success: false, error: 'acos domain error'};
+                result = toMode(Math.acos(value));
+                break;
+            case 'atan': result = toMode(Math.atan(value)); break;
+            default: return {success: false, error: 'Unknown function'};
+        }
+        return {success: true, result: round10(result)};
+    }
+
+    return {tokenize, parse, evaluate, calculate, trig};
+})();
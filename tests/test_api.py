@@ -0,0 +1,314 @@
+"""Behavioral tests for the HTTP API, through the Flask test client."""
+import json
+import os
+import signal
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculator
+
+@pytest.fixture
+def client():
+    calculator.expression_cache.clear()
+    return calculator.app.test_client()
+
+@pytest.fixture
+def history(client, tmp_path, monkeypatch):
+    monkeypatch.setitem(calculator.app.config, 'HISTORY_DATABASE', str(tmp_path / 'history.db'))
+    return client
+
+def post(client, route, payload, **kwargs):
+    return client.post(route, data=json.dumps(payload), content_type='application/json', **kwargs)
+
+def compile_handle(client, expression):
+    return post(client, '/compile', {'expression': expression}).get_json()['handle']
+
+# /calculate
+
+@pytest.mark.parametrize('expression, mode, extra, expected', [
+    ('1/3', 'decimal', {'precision': 5}, '0.33333'),
+    ('1/3', 'decimal', {}, '0.3333333333333333333333333333'),
+    ('1/3+1/6', 'fraction', {}, '1/2'),
+    ('2^100', 'fraction', {}, '1267650600228229401496703205376'),
+])
+def test_exact_modes_return_strings(client, expression, mode, extra, expected):
+    payload = post(client, '/calculate', dict(expression=expression, mode=mode, **extra)).get_json()
+    assert payload == {'success': True, 'result': expected}
+
+@pytest.mark.parametrize('precision', ['abc', True, 0, 1001, 2.5])
+def test_invalid_precision(client, precision):
+    payload = post(client, '/calculate', {'expression': '1/3', 'mode': 'decimal',
+                                          'precision': precision}).get_json()
+    assert payload == {'success': False, 'error': 'Invalid precision'}
+
+@pytest.mark.parametrize('expression, mode, message', [
+    ('0^-1', 'decimal', 'division by zero'),
+    ('(-0)^-2', 'decimal', 'division by zero'),
+    ('1/0', 'fraction', 'division by zero'),
+])
+def test_exact_mode_errors(client, expression, mode, message):
+    payload = post(client, '/calculate', {'expression': expression, 'mode': mode}).get_json()
+    assert payload == {'success': False, 'error': message}
+
+@pytest.mark.parametrize('expression, message, limit', [
+    ('9^9^9', 'Exponent too large', 'max_exponent'),
+    ('2^100000', 'Result too large', 'max_int_bits'),
+    ('2.0^1024', 'Result too large', 'float_range'),
+    ('(' * 150 + '1' + ')' * 150, 'Expression too deeply nested', 'max_depth'),
+    ('+'.join(['1'] * 3000), 'Expression too large', 'max_nodes'),
+    ('1' * 20001, 'Expression too long', 'max_length'),
+])
+def test_limit_payloads(client, expression, message, limit):
+    payload = post(client, '/calculate', {'expression': expression}).get_json()
+    assert payload == {'success': False, 'error': message, 'limit': limit}
+
+def test_cache_counts(client, monkeypatch):
+    monkeypatch.setattr(calculator.expression_cache, 'maxsize', 2)
+    for expression in ['1+1', '1+1', '2+2', '3+3', '1+1']:
+        assert post(client, '/calculate', {'expression': expression}).get_json()['success']
+    stats = client.get('/calculate/cache').get_json()
+    # 1+1 was evicted by 3+3, so the last request misses again
+    assert stats == {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 4, 'evictions': 2}
+
+def test_cache_keys_include_mode_and_precision(client):
+    for mode, precision, expected in [('decimal', 5, '0.33333'), ('decimal', 3, '0.333'),
+                                      ('fraction', 5, '1/3')]:
+        payload = post(client, '/calculate', {'expression': '1/3', 'mode': mode,
+                                              'precision': precision}).get_json()
+        assert payload['result'] == expected
+    assert client.get('/calculate/cache').get_json()['hits'] == 0
+
+def test_offload_recovers_from_a_dead_worker(client):
+    # Over OFFLOAD_COST, so it runs in the process pool
+    payload = {'expression': 'sqrt(2)', 'mode': 'decimal', 'precision': 1000}
+    try:
+        pool = calculator.warm_offload_pool()
+        for process in list(pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+        assert post(client, '/calculate', payload).get_json() == {
+            'success': False, 'error': 'Evaluation worker crashed'}
+        result = post(client, '/calculate', payload).get_json()
+        assert result['success'] and result['result'].startswith('1.41421356237309504880')
+    finally:
+        calculator.shutdown_offload_pool()
+
+# /calculate/batch
+
+def test_batch_reports_errors_per_item(client):
+    payload = post(client, '/calculate/batch', ['1+1', '1/0', 3, '9' * 5000, '2^0.5']).get_json()
+    assert payload == {'success': True, 'results': [
+        {'success': True, 'result': 2},
+        {'success': False, 'error': 'division by zero'},
+        {'success': False, 'error': 'Invalid expression'},
+        {'success': False, 'error': 'Invalid expression'},
+        {'success': True, 'result': 1.4142135624},
+    ]}
+
+def test_batch_exact_mode(client):
+    payload = post(client, '/calculate/batch', {'expressions': ['1/3', '1/0'], 'mode': 'fraction'}).get_json()
+    assert payload == {'success': True, 'results': [
+        {'success': True, 'result': '1/3'},
+        {'success': False, 'error': 'division by zero'},
+    ]}
+
+def test_batch_octet_stream_layout(client):
+    np = pytest.importorskip('numpy')
+    response = post(client, '/calculate/batch', ['1+1', '1/0', 'sqrt(4)'],
+                    headers={'Accept': 'application/octet-stream'})
+    assert response.content_type == 'application/octet-stream'
+    assert response.headers['X-Count'] == '3'
+    assert response.headers['X-Columns'] == 'results'
+    body = response.data
+    # Three little-endian float64 values, then one byte of validity bits
+    assert len(body) == 3 * 8 + 1
+    values = np.frombuffer(body[:24], dtype='<f8')
+    assert values[0] == 2 and np.isnan(values[1]) and values[2] == 2
+    assert body[24] == 0b101
+
+def test_batch_msgpack_layout(client):
+    np = pytest.importorskip('numpy')
+    msgpack = pytest.importorskip('msgpack')
+    response = post(client, '/calculate/batch', ['1+1', 'sqrt(-1)', '3'],
+                    headers={'Accept': 'application/msgpack'})
+    assert response.content_type == 'application/msgpack'
+    payload = msgpack.unpackb(response.data)
+    assert payload['success'] and payload['count'] == 3
+    values = np.frombuffer(payload['columns']['results'], dtype='<f8')
+    assert values[0] == 2 and np.isnan(values[1]) and values[2] == 3
+    assert payload['valid'] == bytes([0b101])
+
+def test_batch_exact_mode_ignores_binary_formats(client):
+    response = post(client, '/calculate/batch', {'expressions': ['1/3'], 'mode': 'fraction'},
+                    headers={'Accept': 'application/octet-stream'})
+    assert response.get_json() == {'success': True, 'results': [{'success': True, 'result': '1/3'}]}
+
+# /calculate/stream
+
+def test_stream(client):
+    response = client.post('/calculate/stream?mode=fraction', data=b'1/3\n1/0\n2+2\n')
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    assert lines == [
+        {'success': True, 'result': '1/3'},
+        {'success': False, 'error': 'division by zero'},
+        {'success': True, 'result': '4'},
+    ]
+
+@pytest.mark.parametrize('precision', ['abc', '', '-1', '2.5'])
+def test_stream_rejects_invalid_precision(client, precision):
+    response = client.post('/calculate/stream?mode=decimal&precision=' + precision, data=b'1/3\n')
+    assert response.get_json() == {'success': False, 'error': 'Invalid precision'}
+
+# /compile and /evaluate
+
+def test_evaluate_bindings(client):
+    handle = compile_handle(client, 'a*x^2+b')
+    payload = post(client, '/evaluate', {'handle': handle, 'bindings': {'a': 2, 'x': 3, 'b': 1}}).get_json()
+    assert payload == {'success': True, 'result': 19}
+    payload = post(client, '/evaluate', {'handle': handle, 'bindings': [{'a': 1, 'x': 1, 'b': 1}, {'a': 1}]}).get_json()
+    assert payload == {'success': True, 'results': [
+        {'success': True, 'result': 2},
+        {'success': False, 'error': 'Missing value for b'},
+    ]}
+
+def test_evaluate_overflow_is_a_limit(client):
+    handle = compile_handle(client, 'x^2')
+    payload = post(client, '/evaluate', {'handle': handle, 'bindings': {'x': 1e200}}).get_json()
+    assert payload == {'success': False, 'error': 'Result too large', 'limit': 'float_range'}
+
+def test_evaluate_columns(client):
+    handle = compile_handle(client, 'sqrt(x)+y')
+    payload = post(client, '/evaluate', {'handle': handle,
+                                         'columns': {'x': [4, -1, 9], 'y': 1}}).get_json()
+    assert payload == {'success': True, 'results': [3, None, 4]}
+
+def test_evaluate_columns_exact_mode(client):
+    handle = compile_handle(client, 'x/3')
+    payload = post(client, '/evaluate', {'handle': handle, 'mode': 'fraction',
+                                         'columns': {'x': [1, 3, 6]}}).get_json()
+    assert payload == {'success': True, 'results': ['1/3', '1', '2']}
+
+def test_evaluate_columns_must_line_up(client):
+    handle = compile_handle(client, 'x+y')
+    payload = post(client, '/evaluate', {'handle': handle,
+                                         'columns': {'x': [1, 2], 'y': [1, 2, 3]}}).get_json()
+    assert payload == {'success': False, 'error': 'Columns must have the same length'}
+
+def test_evaluate_columns_octet_stream(client):
+    np = pytest.importorskip('numpy')
+    handle = compile_handle(client, '1/x')
+    response = post(client, '/evaluate', {'handle': handle, 'columns': {'x': [1, 0, 4]}},
+                    headers={'Accept': 'application/octet-stream'})
+    values = np.frombuffer(response.data[:24], dtype='<f8')
+    assert values[0] == 1 and not np.isfinite(values[1]) and values[2] == 0.25
+    assert response.data[24:] == bytes([0b101])
+
+@pytest.mark.parametrize('value', [
+    123456789012345678901234567890,
+    -123456789012345678901234567890,
+    9999999999999999999,
+    -9999999999999999999,
+    -9223372036854775809,
+])
+def test_big_integers_in_bodies_are_decoded_exactly(client, value):
+    handle = compile_handle(client, 'x+1')
+    payload = post(client, '/evaluate', {'handle': handle, 'mode': 'fraction',
+                                         'bindings': {'x': value}}).get_json()
+    assert payload == {'success': True, 'result': str(value + 1)}
+
+# /tabulate
+
+def test_tabulate(client):
+    pytest.importorskip('numpy')
+    payload = post(client, '/tabulate', {'expression': 'x^2', 'start': -1, 'stop': 1,
+                                         'points': 5, 'max_points': 5}).get_json()
+    assert payload == {'success': True, 'x': [-1.0, -0.5, 0.0, 0.5, 1.0], 'y': [1.0, 0.25, 0.0, 0.25, 1.0]}
+
+def test_tabulate_refines_and_reports_gaps(client):
+    pytest.importorskip('numpy')
+    payload = post(client, '/tabulate', {'expression': 'sqrt(x)', 'start': -1, 'stop': 1,
+                                         'points': 5}).get_json()
+    x, y = payload['x'], payload['y']
+    assert x == sorted(x) and len(x) == len(y) > 5
+    assert all(value is None for value, at in zip(y, x) if at < 0)
+    assert all(value is not None for value, at in zip(y, x) if at >= 0)
+
+@pytest.mark.parametrize('options, message', [
+    ({'expression': 'x+y'}, 'Unknown variable y'),
+    ({'start': 1, 'stop': 1}, 'start must be less than stop'),
+    ({'start': True}, 'Invalid start'),
+    ({'points': 1}, 'Invalid number of points'),
+    ({'tolerance': 0}, 'Invalid tolerance'),
+])
+def test_tabulate_errors(client, options, message):
+    pytest.importorskip('numpy')
+    data = dict({'expression': 'x', 'start': 0, 'stop': 1}, **options)
+    assert post(client, '/tabulate', data).get_json() == {'success': False, 'error': message}
+
+def test_tabulate_octet_stream_layout(client):
+    np = pytest.importorskip('numpy')
+    response = post(client, '/tabulate', {'expression': 'x', 'start': 0, 'stop': 1,
+                                          'points': 3, 'max_points': 3},
+                    headers={'Accept': 'application/octet-stream'})
+    assert response.headers['X-Columns'] == 'x,y'
+    # The x column, then the y column, then the validity bitmap
+    values = np.frombuffer(response.data[:48], dtype='<f8')
+    assert values.tolist() == [0.0, 0.5, 1.0, 0.0, 0.5, 1.0]
+    assert response.data[48:] == bytes([0b111])
+
+# /history
+
+def test_history_pagination(history):
+    entries = [{'expression': '%d+1' % i, 'result': i + 1, 'created': 1000 + i} for i in range(5)]
+    assert post(history, '/history', {'user': 'alice', 'entries': entries}).get_json() == {
+        'success': True, 'appended': 5}
+    post(history, '/history', {'user': 'bob', 'expression': '1+1', 'result': 2})
+
+    seen = []
+    cursor = None
+    while True:
+        query = {'user': 'alice', 'limit': 2}
+        if cursor:
+            query['before'] = cursor
+        payload = history.get('/history', query_string=query).get_json()
+        assert payload['success'] and len(payload['items']) <= 2
+        seen += payload['items']
+        cursor = payload['next']
+        if cursor is None:
+            break
+    assert [item['expression'] for item in seen] == ['4+1', '3+1', '2+1', '1+1', '0+1']
+    assert [item['result'] for item in seen] == [5, 4, 3, 2, 1]
+
+def test_history_filters(history):
+    entries = [{'expression': e, 'result': 0, 'created': c}
+               for e, c in [('sin(1)', 10), ('sqrt(2)', 20), ('cos(1)', 30)]]
+    post(history, '/history', {'user': 'alice', 'entries': entries})
+    payload = history.get('/history', query_string={'user': 'alice', 'prefix': 's'}).get_json()
+    assert [item['expression'] for item in payload['items']] == ['sqrt(2)', 'sin(1)']
+    payload = history.get('/history', query_string={'user': 'alice', 'since': 15, 'until': 30}).get_json()
+    assert [item['expression'] for item in payload['items']] == ['sqrt(2)']
+
+@pytest.mark.parametrize('entry, message', [
+    ({'expression': '1+1', 'created': True}, 'Invalid created time'),
+    ({'expression': '1+1', 'created': 10 ** 400}, 'Invalid created time'),
+    ({'expression': '1+1', 'created': '2024'}, 'Invalid created time'),
+    ({'expression': 1}, 'Invalid expression'),
+])
+def test_history_rejects_invalid_entries(history, entry, message):
+    payload = post(history, '/history', dict(entry, user='alice')).get_json()
+    assert payload == {'success': False, 'error': message}
+
+@pytest.mark.parametrize('query, message', [
+    ({}, 'Missing user'),
+    ({'user': ''}, 'Invalid user'),
+    ({'user': 'alice', 'before': 'abc'}, 'Invalid cursor'),
+    ({'user': 'alice', 'before': '1.0:x'}, 'Invalid cursor'),
+    ({'user': 'alice', 'limit': 0}, 'Invalid limit'),
+])
+def test_history_rejects_invalid_queries(history, query, message):
+    assert history.get('/history', query_string=query).get_json() == {'success': False, 'error': message}
+
+def test_history_cannot_be_deleted_by_parameter(history):
+    assert history.delete('/history', query_string={'user': 'alice'}).status_code == 405
@@ -0,0 +1,102 @@
+"""Regression tests for the expression parser that replaced eval().
+
+Results are checked against Python's own evaluation of the same expression,
+which is what /calculate returned before the AST engine.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import calculator
+
+def result(expression, mode='float'):
+    payload = calculator.calculate(expression, mode)
+    assert payload['success'], payload
+    return payload['result']
+
+def error(expression):
+    payload = calculator.calculate(expression)
+    assert not payload['success'], payload
+    return payload['error']
+
+@pytest.mark.parametrize('expression', [
+    '2+3*4',
+    '(2+3)*4',
+    '10-4-3',
+    '100/10/5',
+    '7//2*3',
+    '2*3%4',
+    '17%5*2',
+    '1+2*3**2',
+    '2*3+4*5-6/4',
+    '(1+2)*(3+4)//5',
+])
+def test_precedence_matches_python(expression):
+    assert result(expression) == round(eval(expression), 10)
+
+@pytest.mark.parametrize('expression, expected', [
+    ('-2^2', -4),
+    ('(-2)^2', 4),
+    ('--3', 3),
+    ('-+-3', 3),
+    ('2*-3', -6),
+    ('2^-1', 0.5),
+    ('-2^-2', -0.25),
+    ('-(1+2)', -3),
+])
+def test_unary_minus(expression, expected):
+    assert result(expression) == expected
+
+@pytest.mark.parametrize('expression, expected', [
+    ('2^3^2', 512),
+    ('2**3**2', 512),
+    ('(2^3)^2', 64),
+    ('2^3^0', 2),
+])
+def test_power_is_right_associative(expression, expected):
+    assert result(expression) == expected
+
+def test_alternate_operator_spellings():
+    assert result('6×7') == result('6*7') == 42
+    assert result('1÷4') == result('1/4') == 0.25
+
+@pytest.mark.parametrize('expression, message', [
+    ('', 'Invalid expression'),
+    ('2+', 'Invalid expression'),
+    ('(1', 'Invalid expression'),
+    ('1)', 'Invalid expression'),
+    ('2 3', 'Invalid expression'),
+    ('2$3', 'Invalid expression'),
+    ('abc', 'Unknown variable abc'),
+    ('foo(2)', 'Unknown function'),
+    ('sqrt(1,2)', 'Wrong number of arguments for sqrt'),
+    ('1/0', 'division by zero'),
+    ('1.0/0', 'float division by zero'),
+    ('\u0663+1', 'Invalid expression'),
+    ('9' * 5000, 'Invalid expression'),
+])
+def test_errors(expression, message):
+    assert error(expression) == message
+
+def test_nesting_limit():
+    assert error('(' * 200 + '1' + ')' * 200) == 'Expression too deeply nested'
+
+@pytest.mark.parametrize('mode, expected', [('float', 1000), ('fraction', '1000'), ('decimal', '1000')])
+def test_long_left_associated_chain(mode, expected):
+    # Within max_nodes, and longer than the recursion limit allows one
+    # frame per operator for
+    assert result('+'.join(['1'] * 1000), mode) == expected
+
+def test_long_chain_compiles_and_evaluates():
+    handle, compiled = calculator.compile_expression('+'.join(['x'] * 999))
+    assert compiled.variables == ['x']
+    assert calculator.evaluate_bindings(compiled, {'x': 2}) == {'success': True, 'result': 1998}
+
+def test_flattened_ast_round_trips():
+    for expression in ['sqrt(2)+comb(5,2)*-(3^2)', '+(-1)', '+'.join(['1'] * 1000)]:
+        # Compared flattened, since == on a deep tuple recurses too
+        items = calculator.flatten(calculator.parse(expression))
+        assert calculator.flatten(calculator.unflatten(items)) == items